@@ -0,0 +1,324 @@
+"""
+ASGI entry point: the /recognize-text, /check-file, /save and /save-config routes of RestAPI (plus
+/images and /metrics) served from an event loop, so one node can hold many connections open while
+cards are being OCR'd.
+
+    uvicorn AsyncAPI:app --host 127.0.0.1 --port 5000
+
+Extraction runs in a process pool (IDEXTRACTOR_ASGI_WORKERS, default one per CPU) whose workers
+load the OCR models at start-up and receive decoded cards through shared memory, database and
+config file I/O run in threads, and on shutdown the server stops taking new cards and waits up to
+IDEXTRACTOR_SHUTDOWN_GRACE seconds for the ones in flight. The result cache, image store, archive
+writer and /metrics live in this process; workers only run ExtractionWorker.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import cv2
+import numpy as np
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+import RestAPI
+from Config import setting
+from ExtractionWorker import PRELOAD_MODULES, init_worker, worker_ready, ExtractShared
+from Instrumentation import metrics, HTTP_REQUESTS
+from ScannerWatcher import ScannerWatcher
+from SharedImage import SharedImage
+
+ASGI_WORKERS = int(setting("ASGIWorkers", "IDEXTRACTOR_ASGI_WORKERS", os.cpu_count() or 2))
+SHUTDOWN_GRACE = float(setting("ShutdownGrace", "IDEXTRACTOR_SHUTDOWN_GRACE", "30"))
+# How often a waiting /check-file looks for the watcher's result; no thread is held while it waits
+CHECK_FILE_POLL_INTERVAL = 0.05
+
+
+class ExtractionPool:
+    """Process pool plus the set of cards in flight, so shutdown can drain them."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+        self.accepting = False
+        self._in_flight = set()
+
+    def start(self):
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(PRELOAD_MODULES)
+        else:
+            # Windows: workers are spawned and import everything themselves
+            context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=init_worker)
+        self.accepting = True
+
+    async def warm_up(self):
+        # Start every worker (and load its OCR models) now instead of on the first requests
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(self.executor, worker_ready) for _ in range(self.workers)])
+        print(f"{len(set(pids))} extraction worker(s) ready")
+
+    def submit(self, func, *args):
+        if not self.accepting:
+            raise RuntimeError("Server is shutting down.")
+        future = self.executor.submit(func, *args)
+        self._in_flight.add(future)
+        future.add_done_callback(self._in_flight.discard)
+        return future
+
+    async def run(self, func, *args):
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def run_blocking(self, func, *args):
+        # For callers on worker threads (the scanner watcher)
+        return self.submit(func, *args).result()
+
+    async def drain(self, timeout):
+        self.accepting = False
+        in_flight = list(self._in_flight)
+        if in_flight:
+            print(f"Waiting for {len(in_flight)} card(s) in flight...")
+            await asyncio.to_thread(concurrent.futures.wait, in_flight, timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def CachedResult(image, char, scantype, tresh, options):
+    # The result cache is looked up here, once for all workers, before a card is sent to one
+    key = RestAPI.ResultCacheKey(image, char, scantype, tresh, options)
+    return key, (RestAPI.result_cache.get(key) if key is not None else None)
+
+
+def CollectResult(key, reply):
+    jsonstring, error, images, worker_metrics = reply
+    metrics.merge(worker_metrics)
+    if error is not None:
+        raise ValueError(error)
+    # Images stored in the worker are only reachable from /images once they are in our store
+    for _, image_data in images:
+        RestAPI.image_store.put(image_data)
+    if key is not None:
+        RestAPI.result_cache.put(key, jsonstring)
+    return jsonstring
+
+
+async def Extract(image, char, scantype, tresh, options=None):
+    if image is None:
+        raise ValueError("Could not decode the image.")
+    key, jsonstring = await asyncio.to_thread(CachedResult, image, char, scantype, tresh, options)
+    if jsonstring is not None:
+        return jsonstring
+    with SharedImage(image) as shared:
+        reply = await extraction_pool.run(ExtractShared, shared.descriptor, char, scantype, tresh, options)
+    return await asyncio.to_thread(CollectResult, key, reply)
+
+
+def ExtractBlocking(image, char, scantype, tresh, options=None):
+    # Extract() for the scanner watcher's threads
+    if image is None:
+        raise ValueError("Could not decode the image.")
+    key, jsonstring = CachedResult(image, char, scantype, tresh, options)
+    if jsonstring is not None:
+        return jsonstring
+    with SharedImage(image) as shared:
+        reply = extraction_pool.run_blocking(ExtractShared, shared.descriptor, char, scantype, tresh, options)
+    return CollectResult(key, reply)
+
+
+def ProcessScannedFile(path, char, tresh):
+    # Raising keeps the file in the folder for the next start; an error result would delete it
+    if not extraction_pool.accepting:
+        raise RuntimeError("Server is shutting down.")
+    # Read, decoded and archived here; only the OCR runs in a worker
+    return RestAPI.ProcessScannedFile(path, char, tresh, extract=ExtractBlocking)
+
+
+extraction_pool = ExtractionPool(ASGI_WORKERS)
+# Scanned files are OCR'd in the process pool too; the watcher thread only waits for the result
+scanner_watcher = ScannerWatcher(ProcessScannedFile, result_ttl=RestAPI.SCAN_RESULT_TTL)
+
+
+def error_response(message, status):
+    return JSONResponse({'error': message}, status_code=status)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def LimitedReceive(receive, max_bytes):
+    # Counts the body as it arrives, so chunked uploads (no Content-Length) are bounded too
+    received = 0
+
+    async def limited_receive():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_bytes:
+                raise UploadTooLarge()
+        return message
+
+    return limited_receive
+
+
+async def recognize_text(request):
+    char = request.path_params['char']
+    threshold = request.path_params['threshold']
+    max_bytes = RestAPI.MaxUploadBytes()
+    too_large = error_response(f"Upload too large, the limit is {max_bytes // (1024 * 1024)} MB", 413)
+    try:
+        content_length = int(request.headers.get('content-length') or 0)
+    except ValueError:
+        return error_response('Invalid Content-Length header', 400)
+    # Refused before reading when the client says how big it is, otherwise while reading
+    if content_length > max_bytes:
+        return too_large
+    request = Request(request.scope, LimitedReceive(request.receive, max_bytes))
+    try:
+        form = await request.form()
+    except UploadTooLarge:
+        return too_large
+    try:
+        if 'image' not in form:
+            return error_response('No image sent', 400)
+        data = await form['image'].read()
+        filename = form['image'].filename
+    finally:
+        await form.close()
+    try:
+        options = RestAPI.ResponseOptionsFromArgs(request.query_params)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    try:
+        # Decoded here (OpenCV releases the GIL) and handed to the worker through shared memory
+        image = await asyncio.to_thread(cv2.imdecode, np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        jsonstring = await Extract(image, char, "Image", threshold, options)
+    except Exception as e:
+        print("Error", str(e))
+        return error_response(str(e), 500)
+    # May block (or write inline) while the archive writer is behind: keep it off the event loop
+    await asyncio.to_thread(RestAPI.SaveOriginalToSavingDir, data, filename)
+    return Response(jsonstring, media_type='application/json')
+
+
+async def check_file(request):
+    try:
+        data_dict = json.loads(await request.body())
+    except json.JSONDecodeError as e:
+        print("JSON decoding error:", e)
+        return error_response('Invalid JSON data', 400)
+    if 'side' not in data_dict:
+        return error_response('the side is not provided in the request body', 400)
+    side = data_dict['side']
+    directory_path, error = await asyncio.to_thread(RestAPI.ResolveScanDirectory, side)
+    if error is not None:
+        return JSONResponse(error[0], status_code=error[1])
+    try:
+        threshold = RestAPI.ParseThreshold(data_dict.get('treshold'))
+    except ValueError as e:
+        return error_response(str(e), 400)
+    if not await asyncio.to_thread(os.path.exists, directory_path):
+        return JSONResponse({'file_found': False})
+    await asyncio.to_thread(scanner_watcher.ensure_watching, side, directory_path, threshold)
+    deadline = time.time() + RestAPI.CHECK_FILE_TIMEOUT
+    while True:
+        result = scanner_watcher.wait_result(side, timeout=0)
+        if result is not None:
+            return Response(result[0], status_code=result[1], media_type='application/json')
+        if time.time() >= deadline:
+            return JSONResponse({'file_found': False})
+        await asyncio.sleep(CHECK_FILE_POLL_INTERVAL)
+
+
+async def save_to_database(request):
+    try:
+        record = await request.json()
+        success, message = await asyncio.to_thread(RestAPI.SaveTODataBase, record)
+        if success:
+            return JSONResponse({'message': message})
+        return error_response(message, 500)
+    except Exception as e:
+        print(e)
+        return error_response(str(e), 500)
+
+
+async def save_config(request):
+    body, status = await asyncio.to_thread(RestAPI.WriteConfig, await request.json())
+    return JSONResponse(body, status_code=status)
+
+
+async def home(request):
+    return PlainTextResponse("OCR Server is running...")
+
+
+async def get_image(request):
+    image_hash = request.path_params['image_hash']
+    if request.headers.get('if-none-match', '').strip('"') == image_hash:
+        return Response(status_code=304)
+    data = RestAPI.image_store.get(image_hash)
+    if data is None:
+        return error_response('Image not found', 404)
+    return Response(data, media_type='image/jpeg', headers={
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'ETag': f'"{image_hash}"',
+    })
+
+
+async def metrics_endpoint(request):
+    # Includes the stage timings and OCR counters the workers sent back with each card
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+class CountRequests:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        async def send_counted(message):
+            if message['type'] == 'http.response.start':
+                HTTP_REQUESTS.inc(endpoint=scope['path'].split('/')[1] or 'home', status=message['status'])
+            await send(message)
+
+        await self.app(scope, receive, send_counted)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    extraction_pool.start()
+    await extraction_pool.warm_up()
+    yield
+    await extraction_pool.drain(SHUTDOWN_GRACE)
+    # Its threads archive the scans they finished; wait for them before flushing the archive
+    await asyncio.to_thread(scanner_watcher.stop, True)
+    await asyncio.to_thread(RestAPI.image_archive.flush, SHUTDOWN_GRACE)
+    if RestAPI.storage is not None:
+        await asyncio.to_thread(RestAPI.storage.close)
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/recognize-text/{char}/{threshold:int}', recognize_text, methods=['POST']),
+        Route('/check-file', check_file, methods=['POST']),
+        Route('/save', save_to_database, methods=['POST']),
+        Route('/save-config', save_config, methods=['POST']),
+        Route('/images/{image_hash}', get_image),
+        Route('/metrics', metrics_endpoint),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+                Middleware(CountRequests)],
+    lifespan=lifespan,
+)
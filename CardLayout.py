@@ -0,0 +1,60 @@
+import functools
+from types import MappingProxyType
+
+import numpy as np
+
+CARD_WIDTH_MM = 85.6
+CARD_HEIGHT_MM = 54.0
+
+# Field geometry per card version and side: (top, bottom, left, right) margins in mm from each card edge.
+# This is the one place to tune where a field is cut from the card.
+LAYOUTS = {
+    'default': {
+        'front': {
+            'front_all': (13.0, 18.0, 30.0, 2.0),
+            'name1': (13.0, 34.0, 30.0, 2.0),
+            'name2': (19.0, 29.0, 30.0, 2.0),
+            'address1': (25.0, 23.0, 30.0, 2.0),
+            'address2': (30.5, 18.0, 30.0, 2.0),
+            'id': (40.0, 5.0, 30.0, 2.0),
+            'face': (5.0, 20.0, 2.0, 60.0),
+        },
+        'back': {
+            'back_all': (7.7, 22.0, 20.0, 17.0),
+            'profession1': (7.7, 42.0, 20.0, 16.0),
+            'profession2': (12.0, 37.0, 20.0, 17.0),
+            'combined1': (16.0, 32.0, 20.0, 30.0),
+            'combined2': (16.0, 32.0, 45.0, 16.5),
+            'religion': (16.0, 33.0, 45.0, 30.0),
+            'gender': (16.0, 33.0, 60.0, 16.5),
+            'marital_status': (16.0, 33.0, 20.0, 45.0),
+            'husband_name': (20.1, 29.0, 30.0, 16.5),
+            'enddate': (25.0, 23.0, 20.0, 40.0),
+            'end_year': (25.0, 23.0, 20.0, 50.3),
+            'end_month': (25.0, 23.0, 36.0, 45.5),
+            'end_day': (25.0, 23.0, 41.0, 40.5),
+        },
+    },
+}
+
+
+@functools.lru_cache(maxsize=64)
+def layout_rects(version, side, height, width):
+    """Pixel rectangles {field: (top, bottom, left, right)} of one layout for a card of height x width
+    pixels. Computed for all fields at once and cached, so same-size scans share them."""
+    fields = LAYOUTS[version][side]
+    names = list(fields)
+    margins = np.array([fields[name] for name in names], dtype=np.float64)
+    pixels_per_mm = np.array([height / CARD_HEIGHT_MM, height / CARD_HEIGHT_MM,
+                              width / CARD_WIDTH_MM, width / CARD_WIDTH_MM])
+    # Truncated like int() on each margin, then the bottom/right margins are measured from the far edge
+    rects = (margins * pixels_per_mm).astype(np.int64)
+    rects[:, 1] = height - rects[:, 1]
+    rects[:, 3] = width - rects[:, 3]
+    return MappingProxyType({name: tuple(int(value) for value in rect) for name, rect in zip(names, rects)})
+
+
+def crop_fields(image, rects, names=None):
+    """Cut the named fields (all of them by default) from `image` as views, no pixels are copied."""
+    return {name: image[top:bottom, left:right]
+            for name, (top, bottom, left, right) in rects.items() if names is None or name in names}
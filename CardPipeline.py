@@ -0,0 +1,194 @@
+"""
+Card pipeline shared by the Flask app, the ASGI app and the extraction worker processes: find the
+card in the image, normalize it and read one side. Nothing here starts threads or holds app-level
+state (caches, queues, watchers), so worker processes can import it on its own.
+"""
+
+import cv2
+import numpy as np
+from IDCroper import CardExtractor
+from CardLayout import CARD_WIDTH_MM, CARD_HEIGHT_MM
+from RequestContext import RequestContext
+from Instrumentation import stage
+from FieldBinarizer import FieldBinarizer
+from Config import setting
+
+# These settings are read for every card, so a config.json change applies to the next request
+
+def DebugDump():
+    # Set IDEXTRACTOR_DEBUG_DUMP=1 to write every intermediate image of a request to its own folder under debug/
+    return str(setting("DebugDump", "IDEXTRACTOR_DEBUG_DUMP", "0")).lower() in ("1", "true")
+
+def Binarization():
+    # How fields are binarized when the request's threshold is 0: "otsu" (per-field histogram) or "adaptive"
+    return setting("Binarization", "IDEXTRACTOR_BINARIZATION", "otsu")
+
+def TargetDPI():
+    # Resample the detected card to this resolution before OCR (IDEXTRACTOR_TARGET_DPI=0 keeps the scan as is).
+    # Tesseract is tuned for ~300 DPI; full-DPI scans only make thresholding, cropping and OCR slower.
+    return float(setting("TargetDPI", "IDEXTRACTOR_TARGET_DPI", "0"))
+
+def NormalizeCardResolution(card, target_dpi):
+    if not target_dpi:
+        return card
+    target_width = int(round(CARD_WIDTH_MM / 25.4 * target_dpi))
+    # Only ever downscale; the mm-based layout in CardExtractor adapts to whatever size we hand it
+    if card.shape[1] <= target_width:
+        return card
+    scale = target_width / card.shape[1]
+    return cv2.resize(card, (target_width, int(round(card.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+
+def CropIDFromScannerImage(image, context=None):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    binary = cv2.bitwise_not(gray)
+
+    (contours, _) = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+
+    max_area = 0
+    max_contour = None
+
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area > max_area:
+            max_area = area
+            max_contour = contour
+
+    if max_contour is not None:
+        (x, y, w, h) = cv2.boundingRect(max_contour)
+        cropped_image = image[y:y + h, x:x + w]
+        if context is not None and context.debug_dump:
+            # Draw on a copy: the original is archived later and must stay untouched
+            detected = image.copy()
+            cv2.rectangle(detected, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            context.dump_image('detected_card.jpg', detected)
+            context.dump_image('cropped_id_card.jpg', cropped_image)
+        
+        return cropped_image
+    else:
+        print("No contours found.")
+        return None
+
+# Bump whenever a change to the pipeline changes the JSON it returns for the same card, so results
+# cached by an older version (the disk tier survives upgrades) are not served any more
+RESULT_FORMAT_VERSION = 1
+
+def OutputSettings():
+    """The resolved settings that change what a card extracts to; part of the result cache key."""
+    return {
+        'version': RESULT_FORMAT_VERSION,
+        'OCRMode': setting("OCRMode", "IDEXTRACTOR_OCR_MODE", "fields"),
+        'OCRMinConfidence': float(setting("OCRMinConfidence", "IDEXTRACTOR_OCR_MIN_CONFIDENCE", "60")),
+        'Binarization': Binarization(),
+        'TargetDPI': TargetDPI(),
+        'DetectionMaxSide': DetectionMaxSide(),
+        'CardLayout': setting("CardLayout", "IDEXTRACTOR_CARD_LAYOUT", "default"),
+    }
+
+def DetectionMaxSide():
+    # Camera photos are searched for the card on a copy no larger than this (longest side, pixels);
+    # the corners found there are mapped back and the warp samples the full-resolution photo
+    return int(setting("DetectionMaxSide", "IDEXTRACTOR_DETECTION_MAX_SIDE", "960"))
+
+def OrderCorners(corners):
+    # top-left, top-right, bottom-right, bottom-left
+    corners = np.asarray(corners, dtype=np.float32).reshape(4, 2)
+    sums = corners.sum(axis=1)
+    diffs = np.diff(corners, axis=1).ravel()
+    return np.array([corners[np.argmin(sums)], corners[np.argmin(diffs)],
+                     corners[np.argmax(sums)], corners[np.argmax(diffs)]], dtype=np.float32)
+
+def FindCardQuad(gray):
+    # Edges of the card on the proxy image; returns 4 corners (proxy coordinates) or None
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(blurred, 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = 0.1 * gray.shape[0] * gray.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            return approx.reshape(4, 2)
+    # No clean quadrilateral (rounded corners, fingers over an edge): fit a rotated rectangle instead
+    if contours:
+        largest = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(largest) >= min_area:
+            return cv2.boxPoints(cv2.minAreaRect(largest))
+    return None
+
+def CropIDFromCameraImage(image, context=None):
+    height, width = image.shape[:2]
+    scale = min(1.0, DetectionMaxSide() / max(height, width))
+    proxy = image if scale == 1.0 else cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    quad = FindCardQuad(cv2.cvtColor(proxy, cv2.COLOR_BGR2GRAY))
+    if quad is None:
+        print("No card outline found, falling back to the scanner crop.")
+        return CropIDFromScannerImage(image, context)
+    corners = OrderCorners(np.asarray(quad, dtype=np.float32) / scale)
+    top_left, top_right, bottom_right, bottom_left = corners
+    card_width = max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))
+    card_height = max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))
+    if card_height > card_width:
+        # Card photographed in portrait: rotate so the long edge becomes the top
+        corners = np.array([top_right, bottom_right, bottom_left, top_left], dtype=np.float32)
+        card_width = card_height
+    # Warp straight to the ID-1 aspect ratio the mm-based layout in CardExtractor expects
+    out_width = int(round(card_width))
+    out_height = int(round(card_width * CARD_HEIGHT_MM / CARD_WIDTH_MM))
+    target = np.array([[0, 0], [out_width - 1, 0], [out_width - 1, out_height - 1], [0, out_height - 1]], dtype=np.float32)
+    card = cv2.warpPerspective(image, cv2.getPerspectiveTransform(corners, target), (out_width, out_height),
+                               flags=cv2.INTER_LINEAR)
+    if context is not None and context.debug_dump:
+        detected = image.copy()
+        cv2.polylines(detected, [corners.astype(np.int32)], True, (0, 255, 0), 2)
+        context.dump_image('detected_card.jpg', detected)
+        context.dump_image('cropped_id_card.jpg', card)
+    return card
+
+def ProcessCard(image,char,scantype,tresh,context=None,options=None,image_store=None):
+        # `image_store` receives the card images of ?image=ref responses
+        # Every request gets its own context so concurrent requests never share files
+        if context is None:
+            context = RequestContext(debug_dump=DebugDump())
+     # Detect the card in the input image
+        with stage("crop"):
+            if scantype == "Scanner":
+                 # Flat scan on a plain background: the largest contour's bounding box is the card
+                 card = CropIDFromScannerImage(image, context)
+            else:
+                 # Camera/webcam photo: find the card outline and undo the perspective
+                 card = CropIDFromCameraImage(image, context)
+        if card is None:
+            raise ValueError("No ID card found in the image.")
+        with stage("normalize"):
+            card = NormalizeCardResolution(card, TargetDPI())
+        # Save the detected card as a new image
+        if char == 'F':
+         context.dump_image('Frontdetected_card.jpg', card)
+         context.dump_image('FrontOriginal.jpg', image)
+        elif char == 'B':
+         context.dump_image('Backdetected_card.jpg', card)
+         context.dump_image('BackOriginal.jpg', image)
+        else:
+            raise ValueError("Invalid character provided. Please provide 'F' for front ID data or 'B' for back ID data.")    
+        print("Card detected")
+        with stage("threshold"):
+            # Only converted to grayscale here; each field is binarized when it is cut (threshold 0 = auto)
+            gray = cv2.cvtColor(card, cv2.COLOR_BGR2GRAY)
+            binarizer = FieldBinarizer(gray, tresh, Binarization())
+        print("processed")
+        if context.debug_dump:
+            context.dump_image('processd_id.jpg', binarizer.full())
+        IDExtractor= CardExtractor(gray,card,context=context,response_options=options,image_store=image_store,binarizer=binarizer)
+        print("IDExtractor" +char)
+        if char=='F':
+            with stage("extract.front"):
+                jsonstring=IDExtractor.getFront_IDData()
+        elif char=='B':
+            with stage("extract.back"):
+                jsonstring=IDExtractor.getBack_IDData()   
+        else:
+            raise ValueError("Invalid character provided. Please provide 'F' for front ID data or 'B' for back ID data.")      
+        
+        return jsonstring
@@ -0,0 +1,110 @@
+import copy
+import json
+import os
+import threading
+import time
+
+CONFIG_PATH = os.environ.get("IDEXTRACTOR_CONFIG", os.path.join(os.getcwd(), "config.json"))
+PATH_KEYS = ("SavePath", "BackPath", "FrontPath")
+
+
+class ServerConfig:
+    """config.json, parsed once and shared by every thread. The file is re-read only when its
+    mtime changes (checked at most every `check_interval` seconds) or after reload(), e.g. from
+    /save-config. Readers get an immutable snapshot; a reload swaps in a new one."""
+
+    def __init__(self, path=CONFIG_PATH, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self.errors = []
+
+    def get(self):
+        """The current settings dict ({} when there is no config file). Do not modify it."""
+        now = time.time()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    mtime = self._stat()
+                    if mtime != self._mtime or self._data is None:
+                        self._load(mtime)
+                    # Only after the load, so no reader skips the check and finds no snapshot yet
+                    self._checked_at = now
+        return self._data
+
+    def exists(self):
+        self.get()
+        return self._mtime is not None
+
+    def reload(self):
+        with self._lock:
+            self._load(self._stat())
+            self._checked_at = time.time()
+
+    def write(self, data):
+        # Temp file plus rename: concurrent readers never see a half-written config
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as config_file:
+            json.dump(data, config_file, indent=4)
+        os.replace(temp_path, self.path)
+        self.reload()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, mtime):
+        data = {}
+        if mtime is not None:
+            try:
+                with open(self.path, 'r') as config_file:
+                    data = json.load(config_file)
+            except Exception as e:
+                print(f"Error reading config file: {str(e)}")
+                # Keep serving the last good settings
+                if self._data is not None:
+                    return
+        self.errors = validate(data)
+        for error in self.errors:
+            print(f"Config warning: {error}")
+        self._data = data
+        self._mtime = mtime
+
+
+def validate(data):
+    errors = []
+    for key in PATH_KEYS:
+        value = data.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str) or (value and not os.path.isabs(value)):
+            errors.append(f"{key} must be an absolute path, got {value!r}")
+    for section in ("Storage", "Tuning"):
+        if section in data and not isinstance(data[section], dict):
+            errors.append(f"{section} must be an object")
+    return errors
+
+
+server_config = ServerConfig()
+
+
+def setting(key, env_name, default=None):
+    """A tuning knob: the environment variable wins, then the "Tuning" section of config.json,
+    then `default`. Values are returned as found; callers convert them like they would env vars."""
+    value = os.environ.get(env_name)
+    if value is None:
+        tuning = server_config.get().get("Tuning")
+        if isinstance(tuning, dict):
+            value = tuning.get(key)
+    return default if value is None else value
+
+
+def section(name, default=None):
+    """A deep copy of one config.json section, safe for the caller to modify."""
+    value = server_config.get().get(name)
+    return copy.deepcopy(value) if value is not None else default
@@ -1,33 +1,120 @@
-import pyodbc
+import queue
+import sqlite3
+import threading
+import time
+
+try:
+    import pyodbc
+except ImportError:
+    # Only needed for the SQL Server backend
+    pyodbc = None
+
+
+class ConnectionPool:
+    """Process-wide pool of pyodbc connections. At most `max_size` connections exist at once;
+    idle connections older than `health_check_interval` seconds are pinged before reuse."""
+
+    def __init__(self, conn_str, max_size=5, health_check_interval=30):
+        self.conn_str = conn_str
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def get(self, timeout=30):
+        try:
+            connection, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.max_size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    return pyodbc.connect(self.conn_str)
+                except pyodbc.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                connection, last_used = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("No database connection available in the pool.")
+        if time.time() - last_used > self.health_check_interval and not self._is_healthy(connection):
+            self.discard(connection)
+            return self.get(timeout)
+        return connection
+
+    def put(self, connection):
+        self._idle.put((connection, time.time()))
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except pyodbc.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _is_healthy(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            return True
+        except pyodbc.Error as e:
+            print("Discarding broken database connection:", e)
+            return False
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(conn_str, max_size=5):
+    with _pools_lock:
+        if conn_str not in _pools:
+            _pools[conn_str] = ConnectionPool(conn_str, max_size=max_size)
+        return _pools[conn_str]
+
 
 class SQLDatabase:
-    def __init__(self, server, database, username=None, password=None):
+    # (server, database[, table]) entries that are known to exist, so the checks run once per process
+    _verified_schema = set()
+
+    def __init__(self, server, database, username=None, password=None, pool_size=None):
         self.server = server
         self.database = database
         self.username = username
         self.password = password
         self.connection = None
+        self.pool = get_connection_pool(self.connection_string(), pool_size) if pool_size else None
+
+    def connection_string(self):
+        if self.username and self.password:
+            # SQL Server Authentication
+            return (
+                f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+                f"SERVER={self.server};"
+                f"DATABASE={self.database};"
+                f"UID={self.username};"
+                f"PWD={self.password}"
+            )
+        # Integrated Security (Windows Authentication)
+        return (
+            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+            f"SERVER={self.server};"
+            f"DATABASE={self.database};"
+            f"Trusted_Connection=yes;"
+        )
 
     def connect(self):
         try:
-            if self.username and self.password:
-                # SQL Server Authentication
-                conn_str = (
-                    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                    f"SERVER={self.server};"
-                    f"DATABASE={self.database};"
-                    f"UID={self.username};"
-                    f"PWD={self.password}"
-                )
+            if self.pool is not None:
+                self.connection = self.pool.get()
             else:
-                # Integrated Security (Windows Authentication)
-                conn_str = (
-                    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                    f"SERVER={self.server};"
-                    f"DATABASE={self.database};"
-                    f"Trusted_Connection=yes;"
-                )
-            self.connection = pyodbc.connect(conn_str)
+                self.connection = pyodbc.connect(self.connection_string())
         except pyodbc.Error as e:
             print("Error: Failed to connect to the database:", e)
             raise
@@ -48,30 +135,244 @@ class SQLDatabase:
     def create_table(self, table_name, columns):
         print("Creating Table")
         # Assuming columns is a dictionary with column names and data types
-        column_defs = ', '.join([f"{column} {data_type}" for column, data_type in columns.items()])
-        query = f"CREATE TABLE {table_name} ({column_defs})"
+        column_defs = ', '.join([f"{self.quote(column)} {data_type}" for column, data_type in columns.items()])
+        query = f"CREATE TABLE {self.quote_table(table_name)} ({column_defs})"
         self.execute_query(query)
+        self._verified_schema.add((self.server, self.database, table_name))
         print(f"Table {table_name} created with columns: {column_defs}")
 
+    @staticmethod
+    def quote(identifier):
+        # Column names come from the client's JSON keys: always bracket-quote them
+        return '[' + str(identifier).replace(']', ']]') + ']'
+
+    @classmethod
+    def quote_table(cls, table_name):
+        return '.'.join(cls.quote(part) for part in table_name.split('.'))
+
+    @classmethod
+    def insert_query(cls, table_name, columns):
+        column_names = ', '.join(cls.quote(column) for column in columns)
+        placeholders = ', '.join(['?'] * len(columns))
+        return f"INSERT INTO {cls.quote_table(table_name)} ({column_names}) VALUES ({placeholders})"
+
     def insert_record(self, table_name, record):
-        column_names = ', '.join(record.keys())
-        placeholders = ', '.join(['?'] * len(record))
-        query = f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})"
+        query = self.insert_query(table_name, list(record.keys()))
         self.execute_query(query, tuple(record.values()))
 
+    def insert_records(self, table_name, records):
+        # Bulk path: one parameter array sent to the server instead of a round-trip per row.
+        # Records with different keys go in separate arrays, all in one transaction.
+        groups = {}
+        for record in records:
+            groups.setdefault(tuple(record.keys()), []).append(tuple(record.values()))
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.fast_executemany = True
+                for columns, rows in groups.items():
+                    cursor.executemany(self.insert_query(table_name, columns), rows)
+                self.connection.commit()
+        except pyodbc.Error as e:
+            print("Error: Failed to execute query:", e)
+            self.connection.rollback()
+            raise
+
     def database_exists(self):
-        query = f"SELECT name FROM sys.databases WHERE name = '{self.database}'"
+        key = (self.server, self.database)
+        if key in self._verified_schema:
+            return True
+        query = "SELECT name FROM sys.databases WHERE name = ?"
         with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchone() is not None
+            cursor.execute(query, self.database)
+            exists = cursor.fetchone() is not None
+        if exists:
+            self._verified_schema.add(key)
+        return exists
 
     def table_exists(self, table_name):
-        query = f"SELECT OBJECT_ID('{table_name}', 'U')"
+        key = (self.server, self.database, table_name)
+        if key in self._verified_schema:
+            return True
+        query = "SELECT OBJECT_ID(?, 'U')"
         with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchone() is not None
+            cursor.execute(query, table_name)
+            row = cursor.fetchone()
+        # OBJECT_ID returns a NULL row rather than no row when the table is missing
+        exists = row is not None and row[0] is not None
+        if exists:
+            self._verified_schema.add(key)
+        return exists
 
-    def close_connection(self):
+    def close_connection(self, broken=False):
         if self.connection:
-            self.connection.close()
+            if self.pool is not None and broken:
+                self.pool.discard(self.connection)
+            elif self.pool is not None:
+                self.pool.put(self.connection)
+            else:
+                self.connection.close()
             self.connection = None
+
+
+class StorageClosedError(RuntimeError):
+    """The backend was closed (e.g. replaced after a config change) before the save reached it."""
+
+
+class StorageBackend:
+    """Where /save records end up. Backends are chosen from the "Storage" section of config.json."""
+
+    def save_records(self, table_name, records):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class SQLServerStorage(StorageBackend):
+    def __init__(self, server, database, username=None, password=None, pool_size=5, schema='dbo'):
+        if pyodbc is None:
+            raise ImportError("pyodbc is required for the SQL Server storage backend.")
+        self.server = server
+        self.database = database
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size
+        self.schema = schema
+
+    def save_records(self, table_name, records):
+        table_name = f"{self.schema}.{table_name}"
+        # Connections come from a process-wide pool and go back to it when we are done
+        db = SQLDatabase(self.server, self.database, self.username, self.password, pool_size=self.pool_size)
+        db.connect()
+        try:
+            # Check if the database exists (cached after the first success)
+            if not db.database_exists():
+                raise NotImplementedError("create_database method is not implemented.")
+            if not db.table_exists(table_name):
+                # Create a table (assuming record provides column names and data types)
+                columns = {col: 'VARCHAR(MAX)' for col in records[0].keys()}
+                print(f"Creating table {table_name} with columns: {columns}")
+                db.create_table(table_name, columns)
+            if len(records) == 1:
+                db.insert_record(table_name, records[0])
+            else:
+                db.insert_records(table_name, records)
+        except Exception:
+            db.close_connection(broken=True)
+            raise
+        db.close_connection()
+
+
+class SQLiteStorage(StorageBackend):
+    """Local SQLite store in WAL mode. Inserts share one open transaction which is committed every
+    `batch_size` records, or after `flush_interval` seconds, whichever comes first. Each
+    save_records() call runs in its own savepoint, so a failed call leaves none of its rows behind."""
+
+    def __init__(self, path, batch_size=100, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # isolation_level=None: we open and commit the batched transactions ourselves
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._first_pending_at = None
+        self._columns = {}
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="sqlite-flush", daemon=True)
+        self._flusher.start()
+
+    def save_records(self, table_name, records):
+        with self._lock:
+            if self._closed.is_set():
+                raise StorageClosedError("The SQLite storage has been closed.")
+            if not self._connection.in_transaction:
+                self._connection.execute("BEGIN")
+                self._first_pending_at = time.time()
+            self._connection.execute("SAVEPOINT save_records")
+            try:
+                self._ensure_columns(table_name, records)
+                columns = self._columns[table_name]
+                # Every record is written with the full column list, missing keys stored as NULL
+                query = (f'INSERT INTO "{table_name}" ({", ".join(self._quote(c) for c in columns)}) '
+                         f'VALUES ({", ".join("?" for _ in columns)})')
+                self._connection.executemany(query, [tuple(record.get(c) for c in columns) for record in records])
+            except Exception:
+                # Undo this call's rows (and any table/columns it added); earlier calls stay pending
+                self._connection.execute("ROLLBACK TO save_records")
+                self._connection.execute("RELEASE save_records")
+                self._columns.pop(table_name, None)
+                raise
+            self._connection.execute("RELEASE save_records")
+            self._pending += len(records)
+            if self._pending >= self.batch_size:
+                self._commit()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        self._closed.set()
+        # Under the lock, so a save in progress finishes (and is committed) before the connection goes
+        with self._lock:
+            self._commit()
+            self._connection.close()
+
+    def _commit(self):
+        if self._connection.in_transaction:
+            self._connection.execute("COMMIT")
+        self._pending = 0
+        self._first_pending_at = None
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if not self._closed.is_set() and self._first_pending_at is not None and time.time() - self._first_pending_at >= self.flush_interval:
+                    self._commit()
+
+    def _ensure_columns(self, table_name, records):
+        known = self._columns.get(table_name)
+        if known is None:
+            existing = [row[1] for row in self._connection.execute(f'PRAGMA table_info("{table_name}")')]
+            if not existing:
+                existing = list(records[0].keys())
+                column_defs = ', '.join(f"{self._quote(c)} TEXT" for c in existing)
+                self._connection.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({column_defs})')
+            known = self._columns[table_name] = existing
+        for record in records:
+            for column in record.keys():
+                if column not in known:
+                    self._connection.execute(f'ALTER TABLE "{table_name}" ADD COLUMN {self._quote(column)} TEXT')
+                    known.append(column)
+
+    @staticmethod
+    def _quote(identifier):
+        return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def create_storage(settings):
+    """Build a storage backend from the "Storage" config section, e.g.
+    {"Backend": "sqlite", "SQLitePath": "idextractor.db", "BatchSize": 100}."""
+    backend = str(settings.get("Backend", "sqlserver")).lower()
+    if backend == "sqlite":
+        return SQLiteStorage(
+            settings.get("SQLitePath", "idextractor.db"),
+            batch_size=int(settings.get("BatchSize", 100)),
+            flush_interval=float(settings.get("FlushInterval", 1.0)),
+        )
+    if backend == "sqlserver":
+        return SQLServerStorage(
+            settings.get("Server", r"AMRO-PC\SQLEXPRESS"),
+            settings.get("Database", "IDExteactor"),
+            username=settings.get("Username"),
+            password=settings.get("Password"),
+            pool_size=int(settings.get("PoolSize", 5)),
+        )
+    raise ValueError(f"Unknown storage backend: {backend}")
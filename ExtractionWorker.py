@@ -0,0 +1,54 @@
+"""
+Entry points of the extraction worker processes used by AsyncAPI (and serve.py).
+
+Only the card pipeline is imported here, never RestAPI: workers must not start the Flask app's job
+queue, archive writer, scanner watcher, result cache or image store. Those live once, in the
+serving process, which also merges the metrics each card sends back.
+"""
+
+import os
+
+import OCRExtractor
+from CardPipeline import ProcessCard
+from Config import setting
+from Instrumentation import metrics
+from ResultCache import ImageStore
+from SharedImage import attach_image
+
+# Imported once in the fork server, so every worker forked from it starts with them already loaded
+PRELOAD_MODULES = ['cv2', 'numpy', 'pytesseract', 'OCRExtractor', 'IDCroper', 'CardPipeline', 'ExtractionWorker']
+
+# Only holds the images of the card being extracted; they are handed back to the serving process
+CARD_IMAGE_STORE_MB = float(setting("ImageStoreMB", "IDEXTRACTOR_IMAGE_STORE_MB", "128"))
+
+
+def init_worker():
+    # Every worker process is a whole card pipeline of its own: keep its field OCR fan-out small so
+    # N processes do not each start a thread per CPU
+    if setting("FieldWorkers", "IDEXTRACTOR_FIELD_WORKERS") is None:
+        os.environ["IDEXTRACTOR_FIELD_WORKERS"] = "2"
+    OCRExtractor.preload_models()
+    OCRExtractor.get_field_executor()
+    # Nothing recorded while loading belongs to a card
+    metrics.take()
+
+
+def worker_ready():
+    return os.getpid()
+
+
+def ExtractShared(descriptor, char, scantype, tresh, options):
+    """Extract one decoded card handed over in shared memory. Returns (json string, error, card
+    images put in the image store, metric updates); exactly one of the first two is None."""
+    image_store = ImageStore(CARD_IMAGE_STORE_MB)
+    shm, image = attach_image(descriptor)
+    jsonstring = error = None
+    try:
+        jsonstring = ProcessCard(image, char, scantype, tresh, options=options, image_store=image_store)
+    except Exception as e:
+        # Reported once the block is closed; the traceback would keep views of it alive
+        error = str(e)
+    finally:
+        image = None
+        shm.close()
+    return jsonstring, error, image_store.items(), metrics.take()
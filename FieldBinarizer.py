@@ -0,0 +1,59 @@
+import threading
+
+import cv2
+
+from Instrumentation import stage
+
+# threshold=0 on the API means "pick it per field"; this chooses how
+AUTO_METHODS = ('otsu', 'adaptive')
+
+
+class FieldBinarizer:
+    """Binarizes only the card regions that are OCR'd, each one once.
+
+    With a fixed `threshold` (> 0) every region gets the same global threshold the whole card used
+    to get, so the pixels are identical to cropping a thresholded card. With threshold 0 each
+    region is thresholded on its own histogram (`auto_method` "otsu") or with a local mean
+    ("adaptive"), so operators no longer rerun the card with a different threshold by hand."""
+
+    def __init__(self, gray, threshold, auto_method='otsu'):
+        if auto_method not in AUTO_METHODS:
+            raise ValueError(f"Unknown binarization method: {auto_method}")
+        self.gray = gray
+        self.threshold = int(threshold)
+        self.auto_method = auto_method
+        self._lock = threading.Lock()
+        self._regions = {}
+
+    @property
+    def method(self):
+        return 'fixed' if self.threshold > 0 else self.auto_method
+
+    def region(self, rect):
+        """The binarized (top, bottom, left, right) region of the card, cached per rect."""
+        with self._lock:
+            binary = self._regions.get(rect)
+        if binary is None:
+            top, bottom, left, right = rect
+            with stage("binarize"):
+                binary = self.binarize(self.gray[top:bottom, left:right])
+            with self._lock:
+                binary = self._regions.setdefault(rect, binary)
+        return binary
+
+    def binarize(self, gray):
+        if gray.size == 0:
+            return gray
+        if self.threshold > 0:
+            _, binary = cv2.threshold(gray, self.threshold, 255, cv2.THRESH_BINARY)
+        elif self.auto_method == 'adaptive':
+            # Neighbourhood about half the field height: text strokes against the local background
+            block = max(3, (min(gray.shape[:2]) // 2) | 1)
+            binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, 10)
+        else:
+            _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        return binary
+
+    def full(self):
+        """The whole card binarized the same way (only used for debug dumps)."""
+        return self.region((0, self.gray.shape[0], 0, self.gray.shape[1]))
@@ -1,22 +1,41 @@
 import cv2
 import json
-from OCRExtractor import OCREngine
-import re
+from OCRExtractor import FieldOCRJobs
+from Instrumentation import stage, timed, FALLBACKS, OCR_CALLS_PER_CARD
+from RequestContext import RequestContext
+from Config import setting
+from KeywordClassifier import keyword_classifier, ANY_GENDER
+from CardLayout import layout_rects, crop_fields
 import numpy as np
 import base64
 
 class CardExtractor:
-    def __init__(self, Graycard_image,RGBCardImage):
+    def __init__(self, Graycard_image,RGBCardImage,context=None,field_jobs=None,ocr_mode=None,min_confidence=None,
+                 response_options=None,image_store=None,layout=None,binarizer=None):
         self.card_image = Graycard_image
         self.RGBCard=RGBCardImage
-        self.card_width_mm = 85.6
-        self.card_height_mm = 54.0
-        self.pixels_per_mm_width = self.card_image.shape[1] / self.card_width_mm
-        self.pixels_per_mm_height = self.card_image.shape[0] / self.card_height_mm
-
-    def reduce_black_space(self, binary_image_path):
-      # Load the binary image
-      image = cv2.imread(binary_image_path, cv2.IMREAD_GRAYSCALE)
+        # Crops stay in memory as views of the card; intermediate images are only written to the
+        # request's own debug directory when debug dumping is on
+        self.context = context if context is not None else RequestContext()
+        # Independent field crops are OCR'd concurrently through a bounded per-card job queue
+        self.field_jobs = field_jobs if field_jobs is not None else FieldOCRJobs()
+        # "fields": OCR every field crop separately; "single_pass": OCR each side once with word boxes
+        # and only re-OCR the fields whose confidence is below min_confidence
+        self.ocr_mode = ocr_mode or setting("OCRMode", "IDEXTRACTOR_OCR_MODE", "fields")
+        self.min_confidence = float(min_confidence if min_confidence is not None else setting("OCRMinConfidence", "IDEXTRACTOR_OCR_MIN_CONFIDENCE", "60"))
+        # How images go back to the client: {"image": "full"|"scaled"|"none"|"ref", "max_width": px, "quality": 1-100}
+        self.response_options = response_options or {}
+        self.image_store = image_store
+        # OCR text -> keyword matches, shared by the gender/religion/marital status classifiers
+        self.keyword_scans = {}
+        # Field geometry comes from the layout table in CardLayout (one per card version)
+        self.layout = layout or setting("CardLayout", "IDEXTRACTOR_CARD_LAYOUT", "default")
+        # With a FieldBinarizer, Graycard_image is the plain grayscale card and only the regions we
+        # cut are binarized; without one it is expected to be binarized already
+        self.binarizer = binarizer
+
+    def reduce_black_space(self, image):
+      # The binary image is passed in directly as an array (a view of the card), no disk round-trip
 
       # Apply morphological operations to reduce black space
       kernel = np.ones((5,5), np.uint8)
@@ -43,91 +62,196 @@ class CardExtractor:
 
       return sentence_image
 
-    def extract_data_area(self, dataTop, dataBottom, dataLeft, dataRight, mode="Gray"):
-        top = int(dataTop * self.pixels_per_mm_height)
-        bottom = self.card_image.shape[0] - int(dataBottom * self.pixels_per_mm_height)
-        left = int(dataLeft * self.pixels_per_mm_width)
-        right = self.card_image.shape[1] - int(dataRight * self.pixels_per_mm_width)
+    def field_rects(self, side):
+        # Pixel rects of every field on this side, shared by all cards of the same size
+        return layout_rects(self.layout, side, self.card_image.shape[0], self.card_image.shape[1])
+
+    def field_area(self, side, name, mode="Gray"):
+        return self.crop(self.field_rects(side)[name], mode)
+
+    def field_areas(self, side, names):
+        if self.binarizer is not None:
+            return {name: self.field_area(side, name) for name in names}
+        return crop_fields(self.card_image, self.field_rects(side), names)
+
+    def crop(self, rect, mode="Gray"):
+        top, bottom, left, right = rect
         if mode == "RGB":
             return self.RGBCard[top:bottom, left:right]
-        
+        if self.binarizer is not None:
+            return self.binarizer.region(rect)
         return self.card_image[top:bottom, left:right]
 
+    def assign_words(self, words, side, region, fields, exclusive=False):
+        """Split the words OCR'd from the `region` field among `fields` (layout names) by where each
+        word's centre falls on the card. With `exclusive`, a word in overlapping fields goes to the nearest one.
+        Returns {name: (text, confidence)}; confidence is the mean word confidence, 0 for no words."""
+        layout = self.field_rects(side)
+        region_top, _, region_left, _ = layout[region]
+        rects = {name: layout[name] for name in fields}
+        assigned = {name: [] for name in fields}
+        for word in words:
+            x = region_left + word['left'] + word['width'] / 2
+            y = region_top + word['top'] + word['height'] / 2
+            hits = [name for name, (top, bottom, left, right) in rects.items()
+                    if top <= y < bottom and left <= x < right]
+            if exclusive and len(hits) > 1:
+                hits = [min(hits, key=lambda name: abs((rects[name][0] + rects[name][1]) / 2 - y))]
+            for name in hits:
+                assigned[name].append(word)
+        return {name: (self.words_to_text(field_words), self.words_confidence(field_words))
+                for name, field_words in assigned.items()}
+
+    def words_to_text(self, words):
+        lines = {}
+        for word in words:
+            lines.setdefault(word['line'], []).append(word['text'])
+        return '\n'.join(' '.join(line) for _, line in sorted(lines.items()))
+
+    def words_confidence(self, words):
+        if not words:
+            return 0.0
+        return sum(word['conf'] for word in words) / len(words)
+
+    def encode_image(self, image):
+        """Encode an image for the JSON response according to response_options.
+        Returns (base64 string or None, content hash or None)."""
+        mode = self.response_options.get('image', 'full')
+        if mode == 'none':
+            return None, None
+        max_width = self.response_options.get('max_width') or (800 if mode == 'scaled' else None)
+        if mode != 'full' and max_width and image.shape[1] > max_width:
+            scale = max_width / image.shape[1]
+            image = cv2.resize(image, (int(max_width), int(image.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        quality = int(self.response_options.get('quality', 95))
+        _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if mode == 'ref' and self.image_store is not None:
+            return None, self.image_store.put(buffer.tobytes())
+        return base64.b64encode(buffer).decode('utf-8'), None
+
+    def add_image(self, data, key, image):
+        encoded, ref = self.encode_image(image)
+        data[key] = encoded
+        if ref is not None:
+            data[key + '_url'] = '/images/' + ref
+
     def save_data_area(self, data_area, output_path):
-        cv2.imwrite(output_path, data_area)
-        print("Data area extraction completed successfully.")
+        self.context.dump_image(output_path, data_area)
+
+    def save_ocr_text(self, text, output_path="rtl_text.txt"):
+        self.context.dump_text(output_path, text)
 
     def extractName(self, OCR):
-        name_data = self.extract_data_area(13.0, 34.0, 30.0, 2.0)
+        name_data = self.field_area('front', 'name1')
         self.save_data_area(name_data, '1st_name_data_area.jpg')
-        name = OCR.extract_arabic_text(name_data)
-        name_data = self.extract_data_area(19.0, 29.0, 30.0, 2.0)
+        name = OCR.arabic(name_data, 'name1')
+        name_data = self.field_area('front', 'name2')
         self.save_data_area(name_data, '2nd_name_data_area.jpg')
-        name2 = OCR.extract_arabic_text(name_data)
-        return name+" "+name2
+        name2 = OCR.arabic(name_data, 'name2')
+        return name.result()+" "+name2.result()
     
     def extractAddress(self, OCR):
-        address_data = self.extract_data_area(25.0, 23.0, 30.0, 2.0)
+        address_data = self.field_area('front', 'address1')
         self.save_data_area(address_data, '1staddress_data_area.jpg')
-        address = OCR.extract_arabic_text(address_data)
+        address = OCR.arabic(address_data, 'address1')
 
-        address_data = self.extract_data_area(30.5, 18.0, 30.0, 2.0)
+        address_data = self.field_area('front', 'address2')
         self.save_data_area(address_data, '2ndaddress_data_area.jpg')
-        address2 = OCR.extract_arabic_text(address_data)
+        address2 = OCR.arabic(address_data, 'address2')
 
-        return address+" "+address2
-    def extractID(self, OCR):
-        id_data = self.extract_data_area(40.0, 5.0, 30.0, 2.0)
+        return address.result()+" "+address2.result()
+    def submitID(self, OCR):
+        id_data = self.field_area('front', 'id')
         self.save_data_area(id_data, 'id_data_area.jpg')
-        ID = str(OCR.extract_numbers(id_data))
+        return OCR.numbers(id_data, 'id')
+    def parseID(self, ID):
+        ID = str(ID)
         ID= ID.replace(" ", "").strip()
         return ID
 
     def getFront_IDData(self):
-        OCR = OCREngine()
-        All_data = self.extract_data_area(13.0, 18.0, 30.0, 2.0)
-        self.save_data_area(All_data, 'Allfront_data_area.jpg')
-        all=OCR.extract_arabic_text(All_data)
-        file_path = "rtl_text.txt"
-      # Open the file in write mode ('w') and specify encoding='utf-8' for handling Arabic text
-        with open(file_path, 'w', encoding='utf-8') as file:
-             file.write(all)
-        # Split the text into lines and remove any empty lines
-        lines = [line for line in all.split('\n') if line.strip()]
-        print(lines)
-        if len(lines) >= 4:
-            # Extract the name and address
-            name = lines[0] + ' ' + lines[1]
-            address = lines[2] + ', ' + lines[3]
+        OCR = self.field_jobs
+        if self.ocr_mode == 'single_pass':
+            name, address, ID = self.readFrontSinglePass()
         else:
-            name =self.extractName(OCR)
-            address = self.extractAddress(OCR)
-        ID=self.extractID(OCR)      
+            All_data = self.field_area('front', 'front_all')
+            self.save_data_area(All_data, 'Allfront_data_area.jpg')
+            all_job=OCR.arabic(All_data, 'front_all')
+            # The ID number does not depend on the name/address OCR, run it alongside
+            id_job=self.submitID(OCR)
+            all=all_job.result()
+            self.save_ocr_text(all)
+            # Split the text into lines and remove any empty lines
+            lines = [line for line in all.split('\n') if line.strip()]
+            print(lines)
+            if len(lines) >= 4:
+                # Extract the name and address
+                name = lines[0] + ' ' + lines[1]
+                address = lines[2] + ', ' + lines[3]
+            else:
+                FALLBACKS.inc(field='name_address', source='field_crops')
+                name =self.extractName(OCR)
+                address = self.extractAddress(OCR)
+            ID=self.parseID(id_job.result())
         DOB = self.extract_date_from_id(ID)
 
-        face_data = self.extract_data_area(5.0, 20.0, 2.0, 60.0,"RGB")
+        face_data = self.field_area('front', 'face', "RGB")
         self.save_data_area(face_data, 'face_data_area.jpg')
-        # Convert the image to base64
-        _, buffer = cv2.imencode('.jpg', self.RGBCard)
-        encoded_image = base64.b64encode(buffer).decode('utf-8')
-        _, buffer = cv2.imencode('.jpg', face_data)
-        encoded_face = base64.b64encode(buffer).decode('utf-8')
-
         # Store data in a dictionary
         data = {
             "name": name,
             "address": address,
             "ID": ID,
             "DOB": DOB,
-            "image": encoded_image,
-            "face": encoded_face
         }
+        # Convert the images to base64 (or a /images reference, or nothing)
+        with stage("encode"):
+            self.add_image(data, "image", self.RGBCard)
+            self.add_image(data, "face", face_data)
 
+        OCR_CALLS_PER_CARD.observe(self.field_jobs.submitted, side='front')
         # Convert dictionary to JSON string
         json_data = json.dumps(data)
         return json_data
     
   
+    def readFrontSinglePass(self):
+        OCR = self.field_jobs
+        All_data = self.field_area('front', 'front_all')
+        self.save_data_area(All_data, 'Allfront_data_area.jpg')
+        words_job = OCR.arabic_words(All_data, 'front_all')
+        id_job = self.submitIDWords(OCR)
+        words = words_job.result()
+        all = self.words_to_text(words)
+        self.save_ocr_text(all)
+        lines = [line for line in all.split('\n') if line.strip()]
+        if len(lines) >= 4:
+            name = lines[0] + ' ' + lines[1]
+            address = lines[2] + ', ' + lines[3]
+        else:
+            # Place the words on the name/address layout, re-OCR only the lines we are unsure of
+            crops = ('name1', 'name2', 'address1', 'address2')
+            fields = self.reocr_low_confidence(self.assign_words(words, 'front', 'front_all', crops, exclusive=True), 'front')
+            name = fields['name1'] + " " + fields['name2']
+            address = fields['address1'] + " " + fields['address2']
+        ID = self.parseID(self.words_to_text(id_job.result()))
+        return name, address, ID
+
+    def submitIDWords(self, OCR):
+        id_data = self.field_area('front', 'id')
+        self.save_data_area(id_data, 'id_data_area.jpg')
+        return OCR.number_words(id_data, 'id')
+
+    def reocr_low_confidence(self, fields, side, kind='arabic'):
+        """Keep the single-pass text of each field unless its confidence is below min_confidence,
+        in which case the field's own crop is OCR'd again. Returns {name: text}."""
+        jobs = {}
+        for name, (text, confidence) in fields.items():
+            if confidence < self.min_confidence:
+                FALLBACKS.inc(field=name, source='low_confidence')
+                jobs[name] = self.field_jobs.submit(kind, self.field_area(side, name), name)
+        return {name: jobs[name].result() if name in jobs else text for name, (text, _) in fields.items()}
+
     def extract_date_from_id(self,id_number):
       # Extract millennium indicator, year, month, and day
       id = str(id_number).replace(' ', '')
@@ -146,30 +270,12 @@ class CardExtractor:
       # Return the date as a datetime object
       return  f"{year}-{month:02d}-{day:02d}" 
     
+    @timed("classify.religion")
     def find_religion(self, text,gender):
        try:
-        # Define regular expressions for the words "مسلم" and "مسيحي"
-        muslim_pattern = re.compile(r'مسلم', re.IGNORECASE)
-        christian_pattern = re.compile(r'مسيحى', re.IGNORECASE)
-        # Split the text into lines and iterate through each line
-        for line in text.split('\n'):
-            # Search for the words in the line
-            muslim_match = muslim_pattern.search(line)
-            christian_match = christian_pattern.search(line)
-            # Return the appropriate word if found in the text
-            if muslim_match:
-                if gender == 'm':
-                    return "مسلم"
-                elif gender == 'f':
-                    return "مسلمة"
-            elif christian_match:
-                if gender == 'm':
-                    return "مسيحي"
-                elif gender == 'f':
-                    return "مسيحية"
-        
-        # If no match found in any line, return None
-        return None
+        match = self.scan_keywords(text).get(('religion', ANY_GENDER))
+        # Without a known gender there is no label to return
+        return match.label(gender) if match else None
        except Exception as e:
         print("Error:", e)
         return None
@@ -197,59 +303,36 @@ class CardExtractor:
         concatenated_img[y3+h1+h2:y3+h1+h2+h3, 0:w3] = img3
 
         return concatenated_img
+    @timed("classify.gender")
     def find_gender(self, text):
      try:
-        # Define regular expression patterns for male and female genders
-        male_patterns = [
-            re.compile(r'ذكر'),
-            re.compile(r'ذ كر'),
-            re.compile(r'دكري'),
-            re.compile(r'دكر')
-        ]
-
-        female_patterns = [
-            re.compile(r'أنثى'),
-            re.compile(r'أنتى'),
-            re.compile(r'انتى'),
-            re.compile(r'آنثى'),
-            re.compile(r'انثى')
-        ]
-
-        # Iterate through each line in the text
-        for line in text.split('\n'):
-            # Search for male patterns
-            for pattern in male_patterns:
-                male_match = pattern.search(line)
-                if male_match:
-                    print("Matched text:", male_match.group())
-                    return "ذكر", 'm'
-
-            # Search for female patterns
-            for pattern in female_patterns:
-                female_match = pattern.search(line)
-                if female_match:
-                    print("Matched text:", female_match.group())
-                    return "أنثى", 'f'
-
-        # If no match found, return empty strings
-        return "", ""
+        match = self.scan_keywords(text).get(('gender', ANY_GENDER))
+        if match:
+            print("Matched text:", match.variant)
+            return match.label(), match.category
+
+        # None (not "") so the callers' fallbacks actually fire
+        return None, None
      except Exception as e:     
         print("Error:", e)
-        return "", ""
+        return None, None
      
-    def extractEndDate(self,OCR):
-      enddate_data = self.extract_data_area(25.0, 23.0, 20.0, 40.0)
-      yeardata=self.extract_data_area(25.0, 23.0, 20.0, 50.3)
-      monthdata=self.extract_data_area(25.0, 23.0, 36.0, 45.5)
-      daydata=self.extract_data_area(25.0, 23.0, 41.0, 40.5)
+    def submitEndDate(self):
+      areas = self.field_areas('back', ('end_year', 'end_month', 'end_day', 'enddate'))
+      yeardata=areas['end_year']
+      monthdata=areas['end_month']
+      daydata=areas['end_day']
       self.save_data_area(monthdata, 'monthdata.jpg')
-      month = OCR.extract_numbers(monthdata)
-      monthstr = str(month).replace(" ", "").strip()
       self.save_data_area(daydata, 'daydata.jpg')
-      day = OCR.extract_numbers(daydata)
-      daystr=str(day).replace(" ", "").strip()
       self.save_data_area(yeardata, 'yeardata.jpg')
-      year = OCR.extract_numbers(yeardata)
+      self.save_data_area(areas['enddate'], 'enddate_data_area.jpg')
+      return (self.field_jobs.numbers(yeardata, 'end_year'),
+              self.field_jobs.numbers(monthdata, 'end_month'),
+              self.field_jobs.numbers(daydata, 'end_day'))
+
+    def parseEndDate(self, year, month, day):
+      monthstr = str(month).replace(" ", "").strip()
+      daystr=str(day).replace(" ", "").strip()
       yearstr=str(year).replace(" ", "").strip()
       print("yearstr"+yearstr)
       print("monthstr"+monthstr)
@@ -270,9 +353,9 @@ class CardExtractor:
          daystr="0"+daystr[1]
       if int(monthstr[0]) == 8:
          monthstr="0"+monthstr[1]
-      self.save_data_area(enddate_data, 'enddate_data_area.jpg')
       enddate = yearstr+"-"+monthstr+"-"+daystr
       return enddate 
+
     def get_last_two_digits(self,number):
         # Convert the number to a string
         number_str = str(number)
@@ -282,196 +365,165 @@ class CardExtractor:
         else:
             last_two_digits = number_str
         return last_two_digits
+    @timed("classify.marital_status")
     def find_Mstatus(self, text, gender):
      try:
-        if gender == 'm':
-            single_patterns = [
-                re.compile(r'أعزب'),
-                re.compile(r'اعرب'),
-                re.compile(r'اغزب'),
-                re.compile(r'اغزب'),
-                re.compile(r'اعزب'),
-                re.compile(r'اعرب'),
-                re.compile(r'أعرب'),               
-                re.compile(r'أعزب'),  # Include optional ending for gender-neutral matching
-                re.compile(r'عازب'),
-                re.compile(r'عازب')  # Include optional ending for gender-neutral matching
-            ]
-            married_patterns = [
-                re.compile(r'متزوج'),
-                re.compile(r'متزوح'),
-                re.compile(r'متروج'),  # Include optional ending for female gender
-                re.compile(r'منروج'),
-                re.compile(r'منروج')  # Include optional ending for female gender
-            ]
-            divorced_patterns = [
-                re.compile(r'مطلق'),
-                re.compile(r'مطلف'),
-            ]
-            widower_patterns = [
-                re.compile(r'أرمل'),
-                re.compile(r'ارمل'),
-            ]
-        elif gender=='f':
-            single_patterns = [
-                re.compile(r'عزباء'),
-                re.compile(r'عزب'),  # Include optional ending for male gender
-                re.compile(r'عزبة'),
-                re.compile(r'عازبة|عازب')  # Include optional ending for gender-neutral matching
-            ]
-            married_patterns = [
-                re.compile(r'متزوجة'),
-                re.compile(r'متزوج|متزوجة'),  # Include optional ending for male gender
-                re.compile(r'مزوجة'),
-                re.compile(r'مزوج|مزوجة')  # Include optional ending for male gender
-            ]
-            divorced_patterns = [
-                re.compile(r'مطلقة'),
-                re.compile(r'مطلق')
-            ]
-            widower_patterns = [
-                re.compile(r'أرملة'),
-                re.compile(r'أرمل')
-            ]
-
-        # Iterate through each line in the text
-        for line in text.split('\n'):
-            # Search for single patterns
-            for pattern in single_patterns:
-                single_match = pattern.search(line)
-                if single_match:
-                    if gender == 'm':
-                        print("Matched text:", single_match.group(),"gender="+gender)
-                        return "أعزب"  
-                    elif gender == 'f':
-                        return "عزباء"
-
-            # Search for married patterns
-            for pattern in married_patterns:
-                married_match = pattern.search(line)
-                if married_match:
-                    if gender == 'm':
-                       return "متزوج" 
-                    elif gender == 'f':
-                       return "متزوجة"
-
-            # Search for divorced patterns
-            for pattern in divorced_patterns:
-                divorced_match = pattern.search(line)
-                if divorced_match:
-                  if gender == 'm':
-                       return "مطلق"
-                  elif gender == 'f':
-                       return "مطلقة"
-
-            # Search for widower patterns
-            for pattern in widower_patterns:
-                widower_match = pattern.search(line)
-                if widower_match:
-                    if gender == 'm':
-                       return "أرمل"
-                    elif gender == 'f':
-                       return "أرملة"
-
-        # If no match found, return None
-        return None
+        # Spellings depend on the gender: "عزب" means single on a female card only
+        match = self.scan_keywords(text).get(('marital_status', gender))
+        return match.label(gender) if match else None
      except Exception as e:
         print("Error:", e)
         return None
-    def getBack_IDData(self):
-      OCR = OCREngine()
-      All_data = self.extract_data_area(7.7, 22.0, 20.0, 17.0)
+    def scan_keywords(self, text):
+      # The same OCR text is classified for gender, religion and marital status: scan it once
+      if text not in self.keyword_scans:
+        self.keyword_scans[text] = keyword_classifier.scan(text)
+      return self.keyword_scans[text]
+    def readBackFields(self):
+      OCR = self.field_jobs
+      # Always needed: the All area, the profession lines and the end date
+      areas = self.field_areas('back', ('back_all', 'profession1', 'profession2'))
+      All_data = areas['back_all']
       self.save_data_area(All_data, 'All_data_area.jpg')
-      All_ocr = OCR.extract_arabic_text(All_data)
-      # Specify the file path where you want to save the text file
-      file_path = "rtl_text.txt"
-      # Open the file in write mode ('w') and specify encoding='utf-8' for handling Arabic text
-      with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(All_ocr)
+      All_job = OCR.arabic(All_data, 'back_all')
 
       # Extract profession data
-      profession_data1 = self.extract_data_area(7.7, 42.0, 20.0, 16.0)
-      profession_data2= self.extract_data_area(12.0, 37.0, 20.0, 17.0)
+      profession_data1 = areas['profession1']
+      profession_data2= areas['profession2']
 
       self.save_data_area(profession_data1, 'profession1_data_area.jpg')
       self.save_data_area(profession_data2, 'profession2_data_area.jpg')
-      profession1 = OCR.extract_arabic_text(profession_data1)
-      profession2 = OCR.extract_arabic_text(profession_data2)
-      #if profession1==" " or profession2==" "or profession1==""or profession2 == "":
-       #  lines = All_ocr.splitlines()
-         # Concatenate the first two lines with spaces between them
-        # if len(lines) >= 2:
-         #   profession = f"{lines[0]} {lines[1]}"  # Adjust the number
-         ##   profession=profession1+" "+profession2    
-      #else:
-      profession=profession1+" "+profession2    
-      # Extract religion data
-      religion_data = self.extract_data_area(16.0, 33.0, 45.0, 30.0)
-      gender_data =self.extract_data_area(16.0, 33.0, 60.0, 16.5)
-      Mstatus_Data=self.extract_data_area(16.0, 33.0, 20.0, 45.0)
-      self.save_data_area(religion_data, 'religion_data.jpg')
-      self.save_data_area(Mstatus_Data, 'Mstatus_Data.jpg')
-      self.save_data_area(gender_data, 'gender_data.jpg')
-      CompinedDataArea = self.extract_data_area(16.0, 32.0, 20.0, 30.0)   
-      CompinedDataArea2 = self.extract_data_area(16.0, 32.0, 45.0, 16.5)    
- 
-      self.save_data_area(CompinedDataArea, 'CompinedDataArea.jpg')
-      self.save_data_area(CompinedDataArea2, 'CompinedDataArea2.jpg')
-
-      combined=self.reduce_black_space('CompinedDataArea.jpg')
-      combined2=self.reduce_black_space('CompinedDataArea2.jpg')
-
-      self.save_data_area(combined, 'combinedCropedarea.jpg')
-      self.save_data_area(combined2, 'combinedCropedarea2.jpg')
-
-      compinedtext = OCR.extract_arabic_text(combined)
-      compinedtext2 = OCR.extract_arabic_text(combined2)
-      print('compinedtext2', compinedtext2)
-
-      print('compinedtext', compinedtext)
-      religion=OCR.extract_arabic_text(religion_data)   
-      print('religion',religion)
-      gender=OCR.extract_arabic_text(gender_data)
-      print('gender',gender)
-      marital_status=OCR.extract_arabic_text(Mstatus_Data)
-      print('Mstatus',marital_status)
-      genderChar='m'
-      Gender,genderChar=self.find_gender(All_ocr)
-      if Gender is None:
-         Gender,genderChar=self.find_gender(compinedtext)
-      if Gender is None:
-         Gender,genderChar=self.find_gender(compinedtext2)   
-      if Gender is None:
-         Gender,genderChar=self.find_gender(gender)
-      Religion=self.find_religion(All_ocr,genderChar)
-      if Religion is None:
-         Religion=self.find_religion(compinedtext,genderChar)
-      if Religion is None:
-         Religion=self.find_religion(compinedtext2,genderChar)   
-      if Religion is None:
-         Religion=self.find_religion(religion,genderChar)       
-      Mstatus=self.find_Mstatus(All_ocr,genderChar) 
-      if Mstatus is None:
-         Mstatus=self.find_Mstatus(compinedtext,genderChar)   
-      if Mstatus is None:
-         Mstatus=self.find_Mstatus(compinedtext2,genderChar)   
-      if Mstatus is None:
-         Mstatus=self.find_Mstatus(marital_status,genderChar)  
-
-      enddate=self.extractEndDate(OCR)
-
-      if genderChar == 'f':
+      profession1_job = OCR.arabic(profession_data1, 'profession1')
+      profession2_job = OCR.arabic(profession_data2, 'profession2')
+      enddate_jobs = self.submitEndDate()
+
+      # Gather: the card takes as long as its slowest field, not the sum of all of them
+      All_ocr = All_job.result()
+      self.save_ocr_text(All_ocr)
+      profession=profession1_job.result()+" "+profession2_job.result()
+      return {
+        'all': All_ocr,
+        'profession': profession,
+        'enddate': [job.result() for job in enddate_jobs],
+        'husband_name': None,
+        # Fallback sources for the classifiers, only OCR'd when the chain reaches them
+        'sources': {
+          'combined1': lambda: self.readCombinedArea('combined1', 'CompinedDataArea.jpg', 'combinedCropedarea.jpg'),
+          'combined2': lambda: self.readCombinedArea('combined2', 'CompinedDataArea2.jpg', 'combinedCropedarea2.jpg'),
+          'religion_crop': lambda: self.readFieldArea('religion', 'religion_data.jpg'),
+          'gender_crop': lambda: self.readFieldArea('gender', 'gender_data.jpg'),
+          'marital_status_crop': lambda: self.readFieldArea('marital_status', 'Mstatus_Data.jpg'),
+        },
+      }
+
+    def readCombinedArea(self, name, area_file, cropped_file):
+      area = self.field_area('back', name)
+      self.save_data_area(area, area_file)
+      combined = self.reduce_black_space(area)
+      self.save_data_area(combined, cropped_file)
+      text = self.field_jobs.arabic(combined, name).result()
+      print(name, text)
+      return text
+
+    def readFieldArea(self, name, area_file):
+      area = self.field_area('back', name)
+      self.save_data_area(area, area_file)
+      text = self.field_jobs.arabic(area, name).result()
+      print(name, text)
+      return text
+
+    def readBackSinglePass(self):
+      OCR = self.field_jobs
+      All_data = self.field_area('back', 'back_all')
+      self.save_data_area(All_data, 'All_data_area.jpg')
+      words_job = OCR.arabic_words(All_data, 'back_all')
+      enddate_data = self.field_area('back', 'enddate')
+      self.save_data_area(enddate_data, 'enddate_data_area.jpg')
+      date_words_job = OCR.number_words(enddate_data, 'enddate')
+
+      words = words_job.result()
+      All_ocr = self.words_to_text(words)
+      self.save_ocr_text(All_ocr)
+      # Every field below is a sub-rectangle of the All data area
+      fields = self.assign_words(words, 'back', 'back_all', ('profession1', 'profession2', 'combined1', 'combined2',
+                                                             'religion', 'gender', 'marital_status', 'husband_name'))
+      profession = self.reocr_low_confidence({name: fields[name] for name in ('profession1', 'profession2')}, 'back')
+      date_crops = ('end_year', 'end_month', 'end_day')
+      dates = self.reocr_low_confidence(
+        self.assign_words(date_words_job.result(), 'back', 'enddate', date_crops, exclusive=True), 'back', kind='numbers')
+      husband_text, husband_confidence = fields['husband_name']
+      return {
+        'all': All_ocr,
+        'profession': profession['profession1']+" "+profession['profession2'],
+        'enddate': [dates['end_year'], dates['end_month'], dates['end_day']],
+        # Only trusted when confident, otherwise the crop is OCR'd if the card turns out to be female
+        'husband_name': husband_text if husband_confidence >= self.min_confidence else None,
+        # The words already placed on each crop are free; a crop is only re-OCR'd when it is reached
+        # in a fallback chain and its words were not confident enough
+        'sources': {
+          'combined1': lambda: self.reocr_low_confidence({'combined1': fields['combined1']}, 'back')['combined1'],
+          'combined2': lambda: self.reocr_low_confidence({'combined2': fields['combined2']}, 'back')['combined2'],
+          'religion_crop': lambda: self.reocr_low_confidence({'religion': fields['religion']}, 'back')['religion'],
+          'gender_crop': lambda: self.reocr_low_confidence({'gender': fields['gender']}, 'back')['gender'],
+          'marital_status_crop': lambda: self.reocr_low_confidence({'marital_status': fields['marital_status']}, 'back')['marital_status'],
+        },
+      }
+
+    def classifyWithFallbacks(self, field, classify, texts, chain):
+      """Run `classify` on the All text, then on each source in `chain` until it returns something.
+      A source is read (and OCR'd if needed) only when reached, and once per card.
+      Returns (result, source) with source 'all' when no fallback was needed, or (None, None)."""
+      result = classify(texts['all'])
+      if result is not None:
+        return result, 'all'
+      for source in chain:
+        FALLBACKS.inc(field=field, source=source)
+        if source not in self.source_texts:
+          self.source_texts[source] = texts['sources'][source]()
+        result = classify(self.source_texts[source])
+        if result is not None:
+          return result, source
+      return None, None
+
+    def matchGender(self, text):
+      Gender, genderChar = self.find_gender(text)
+      return (Gender, genderChar) if Gender is not None else None
+
+    def getBack_IDData(self):
+      OCR = self.field_jobs
+      if self.ocr_mode == 'single_pass':
+        texts = self.readBackSinglePass()
+      else:
+        texts = self.readBackFields()
+      profession = texts['profession']
+      self.source_texts = {}
+      # Each fallback crop is only OCR'd when every source before it failed
+      gender_match, gender_source = self.classifyWithFallbacks(
+        'gender', self.matchGender, texts, ('combined1', 'combined2', 'gender_crop'))
+      Gender, genderChar = gender_match if gender_match is not None else ("", None)
+      if genderChar is not None:
+        Religion, religion_source = self.classifyWithFallbacks(
+          'religion', lambda text: self.find_religion(text, genderChar), texts, ('combined1', 'combined2', 'religion_crop'))
+        Mstatus, marital_status_source = self.classifyWithFallbacks(
+          'marital_status', lambda text: self.find_Mstatus(text, genderChar), texts, ('combined1', 'combined2', 'marital_status_crop'))
+      else:
+        # Both labels depend on the gender: no point OCRing more crops for them
+        Religion, religion_source = None, None
+        Mstatus, marital_status_source = None, None
+
+      enddate=self.parseEndDate(*texts['enddate'])
+
+      if genderChar == 'f' and texts['husband_name'] is not None:
+        husband_name = texts['husband_name']
+      elif genderChar == 'f':
         # Extract husband's name data
-        husband_name_data = self.extract_data_area(20.1, 29.0, 30.0, 16.5)
+        husband_name_data = self.field_area('back', 'husband_name')
         self.save_data_area(husband_name_data, 'husband_name_data_area.jpg')
-        husband_name = OCR.extract_arabic_text(husband_name_data)
+        husband_name = OCR.arabic(husband_name_data, 'husband_name').result()
       else :
         husband_name = ' '  
 
       
-      # Convert the image to base64
-      _, buffer = cv2.imencode('.jpg', self.RGBCard)
-      encoded_image = base64.b64encode(buffer).decode('utf-8')
       print(husband_name)
       # Store data in a dictionary
       data = {
@@ -481,9 +533,18 @@ class CardExtractor:
         'marital_status': Mstatus,
         'enddate': enddate,
         'husband_name': husband_name,
-        'image': encoded_image,
+        # Where each classified field was found: "all", a fallback source, or null when not found
+        'fallbacks': {
+          'gender': gender_source,
+          'religion': religion_source,
+          'marital_status': marital_status_source,
+        },
       }
+      # Convert the image to base64 (or a /images reference, or nothing)
+      with stage("encode"):
+        self.add_image(data, 'image', self.RGBCard)
 
+      OCR_CALLS_PER_CARD.observe(self.field_jobs.submitted, side='back')
       # Convert dictionary to JSON string
       json_data = json.dumps(data)
       return json_data
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+
+from Instrumentation import ARCHIVE_WRITES
+
+# Magic numbers of the formats scanners and cameras hand us, so originals keep their real extension
+_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'II*\x00', '.tif'),
+    (b'MM\x00*', '.tif'),
+    (b'BM', '.bmp'),
+)
+
+
+def guess_extension(data, filename=None):
+    for signature, extension in _SIGNATURES:
+        if data[:len(signature)] == signature:
+            return extension
+    extension = os.path.splitext(filename or '')[1].lower()
+    return extension or '.bin'
+
+
+class ImageArchive:
+    """Background writer for the scans kept in the configured SavePath.
+
+    Requests only enqueue the original uploaded bytes, which are written as they are. Files land in
+    <SavePath>/<YYYY-MM-DD>/<hash[:2]>/<hash><ext> so no single folder grows without bound, and
+    identical scans are stored once. Every scan is archived: when `max_queued` scans are already waiting the caller blocks for up to
+    `enqueue_timeout` seconds, and if the writer still has no room the scan is written on the
+    caller's thread instead. The queue depth is the signal to alert on."""
+
+    def __init__(self, resolve_directory, max_queued=256, batch_size=32, enqueue_timeout=5.0):
+        # Called on the writer thread, once per batch, to find the SavePath
+        self.resolve_directory = resolve_directory
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._created = set()
+        self._writer = threading.Thread(target=self._run, name="image-archive", daemon=True)
+        self._writer.start()
+
+    def submit_bytes(self, data, filename=None):
+        """Archive the original encoded bytes of a scan."""
+        if not data:
+            return False
+        return self._enqueue((bytes(data), guess_extension(data, filename)))
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """Wait until every queued scan is written (or `timeout` seconds pass)."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _enqueue(self, item):
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            ARCHIVE_WRITES.inc(result='inline')
+            print("Warning: image archive queue is full, writing the scan on the request thread.")
+            self._write_batch([item])
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        try:
+            directory = self.resolve_directory()
+        except Exception as e:
+            print(f"Error resolving the archive directory: {str(e)}")
+            directory = None
+        if not directory:
+            ARCHIVE_WRITES.inc(len(batch), result='skipped')
+            print("Warning: SavePath is not configured. Skipping image save.")
+            return
+        day = time.strftime('%Y-%m-%d')
+        for data, extension in batch:
+            try:
+                digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+                folder = os.path.join(directory, day, digest[:2])
+                if folder not in self._created:
+                    os.makedirs(folder, exist_ok=True)
+                    self._created.add(folder)
+                path = os.path.join(folder, digest + extension)
+                if not os.path.exists(path):
+                    # Write under a temporary name first so a crash never leaves a truncated scan
+                    with open(path + '.tmp', 'wb') as archive_file:
+                        archive_file.write(data)
+                    os.replace(path + '.tmp', path)
+                ARCHIVE_WRITES.inc(result='written')
+            except Exception as e:
+                ARCHIVE_WRITES.inc(result='failed')
+                print(f"Error saving image: {str(e)}")
@@ -0,0 +1,202 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Callables taking (stage_name, seconds); the benchmark harness and the metrics endpoint register here
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def record(name, seconds):
+    for sink in list(_sinks):
+        sink(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time a block of the extraction pipeline and report it to every registered sink."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def take(self):
+        """The values recorded so far, reset to zero (see MetricsRegistry.take)."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+        self._observations = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value)
+            self._observations[key] = self._observations.get(key, 0) + 1
+
+    def take(self):
+        with self._lock:
+            values, self._values = self._values, {}
+            observations, self._observations = self._observations, {}
+        return values, observations
+
+    def merge(self, taken):
+        values, observations = taken
+        with self._lock:
+            for key, (counts, total) in values.items():
+                merged, merged_total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+                self._values[key] = ([a + b for a, b in zip(merged, counts)], merged_total + total)
+                self._observations[key] = self._observations.get(key, 0) + observations[key]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                observations = self._observations[key]
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {observations}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {observations}")
+        return lines
+
+
+class Gauge:
+    """A value sampled from `function` whenever the metrics are rendered."""
+
+    def __init__(self, name, help_text, function):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.function()}"]
+
+
+class MetricsRegistry:
+    """Minimal Prometheus text-format registry, served on /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets):
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, function):
+        metric = Gauge(name, help_text, function)
+        self._metrics.append(metric)
+        return metric
+
+    def take(self):
+        """Counter and histogram updates since the last take(), reset to zero. Extraction worker
+        processes send these back with each card; the serving process merge()s them, so its
+        /metrics covers the work done in the workers."""
+        return {metric.name: metric.take() for metric in self._metrics if hasattr(metric, 'take')}
+
+    def merge(self, updates):
+        for metric in self._metrics:
+            if metric.name in updates:
+                metric.merge(updates[metric.name])
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    'idextractor_stage_seconds', 'Time spent in each stage of the extraction pipeline.',
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+OCR_CALLS = metrics.counter('idextractor_ocr_calls_total', 'Tesseract calls, by field.')
+OCR_CALLS_PER_CARD = metrics.histogram(
+    'idextractor_ocr_calls_per_card', 'Tesseract calls needed for one card side.',
+    (1, 2, 3, 4, 6, 8, 10, 12, 16, 20))
+FALLBACKS = metrics.counter('idextractor_fallback_total', 'Fallback extraction paths taken, by field and source.')
+CACHE_LOOKUPS = metrics.counter('idextractor_result_cache_total', 'Result cache lookups, by result and tier.')
+ARCHIVE_WRITES = metrics.counter('idextractor_archive_writes_total', 'Scans handed to the archive writer, by result.')
+HTTP_REQUESTS = metrics.counter('idextractor_http_requests_total', 'HTTP requests, by endpoint and status code.')
+
+add_sink(lambda name, seconds: STAGE_SECONDS.observe(seconds, stage=name))
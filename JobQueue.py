@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, func, args):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Bounded in-process job queue with worker threads. Submitting to a full queue raises
+    QueueFullError so callers can push back; finished jobs (their result only, not their input)
+    are kept for `result_ttl` seconds, and at most `max_finished` of them."""
+
+    def __init__(self, workers=2, max_queued=100, result_ttl=600, max_finished=1000):
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        # Finished job ids, oldest first
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, func, *args):
+        job = Job(func, args)
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError("Job queue is full, try again later.")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_expired()
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """Long-poll: block until the job finishes or `timeout` seconds pass."""
+        deadline = time.time() + timeout
+        with self._changed:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+            while job is not None and job.status in ('queued', 'running'):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return job
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                job.status = 'running'
+            try:
+                result, error, status = job.func(*job.args), None, 'done'
+            except Exception as e:
+                print("Error", str(e))
+                result, error, status = None, str(e), 'failed'
+            with self._changed:
+                # The input (e.g. the uploaded image) is not needed once the job ran
+                job.func = job.args = None
+                job.result = result
+                job.error = error
+                job.status = status
+                job.finished_at = time.time()
+                self._finished[job.id] = None
+                self._evict_expired()
+                self._changed.notify_all()
+            self._queue.task_done()
+
+    def _evict_expired(self):
+        # Caller holds the lock. Jobs finish in order, so expired ones are at the front
+        now = time.time()
+        while self._finished:
+            job_id = next(iter(self._finished))
+            job = self._jobs.get(job_id)
+            if (job is not None and len(self._finished) <= self.max_finished
+                    and now - job.finished_at <= self.result_ttl):
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
@@ -0,0 +1,77 @@
+import bisect
+import json
+import os
+import re
+
+# Variant spellings (including common OCR misreadings) live in this file rather than in code
+KEYWORDS_PATH = os.environ.get(
+    "IDEXTRACTOR_KEYWORDS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocr_keywords.json"))
+
+ANY_GENDER = '*'
+
+
+class KeywordMatch:
+    def __init__(self, attribute, category, labels, variant, start, line):
+        self.attribute = attribute
+        self.category = category
+        self.labels = labels
+        self.variant = variant
+        self.start = start
+        self.line = line
+
+    def label(self, gender=None):
+        """Display text for the match; None when it depends on a gender we do not know."""
+        if isinstance(self.labels, dict):
+            return self.labels.get(gender)
+        return self.labels
+
+
+class KeywordClassifier:
+    """Finds gender, religion and marital status keywords in OCR text with one precompiled
+    alternation regex, scanning each text once for every attribute together.
+
+    Like the per-line loops it replaces, the earliest line with a match wins and, within a line,
+    the category listed first in the vocabulary wins."""
+
+    def __init__(self, vocabulary):
+        entries = {}
+        self._labels = {}
+        for attribute, spec in vocabulary.items():
+            for rank, category in enumerate(spec['categories']):
+                self._labels[(attribute, category['name'])] = category['labels']
+                variants = category['variants']
+                if isinstance(variants, list):
+                    variants = {ANY_GENDER: variants}
+                for gender, words in variants.items():
+                    for word in words:
+                        entries.setdefault(word, set()).add((attribute, gender, rank, category['name']))
+        # A matched variant also counts for every shorter variant inside it ("اعزب" contains "عزب"),
+        # since the regex only reports the longest alternative at each position
+        self._entries = {
+            variant: sorted(set().union(*(entries[other] for other in entries if other in variant)))
+            for variant in entries
+        }
+        self._pattern = re.compile('|'.join(re.escape(variant) for variant in sorted(entries, key=len, reverse=True)))
+
+    def scan(self, text):
+        """Returns {(attribute, gender): KeywordMatch} with the best match for each attribute,
+        gender being '*' for attributes whose spellings do not depend on it."""
+        line_starts = [0] + [i + 1 for i, char in enumerate(text) if char == '\n']
+        best = {}
+        for found in self._pattern.finditer(text):
+            line = bisect.bisect_right(line_starts, found.start()) - 1
+            for attribute, gender, rank, category in self._entries[found.group()]:
+                key = (attribute, gender)
+                order = (line, rank, found.start())
+                if key not in best or order < best[key][0]:
+                    best[key] = (order, KeywordMatch(attribute, category, self._labels[(attribute, category)],
+                                                     found.group(), found.start(), line))
+        return {key: match for key, (_, match) in best.items()}
+
+
+def load_classifier(path=KEYWORDS_PATH):
+    with open(path, encoding='utf-8') as keywords_file:
+        return KeywordClassifier(json.load(keywords_file))
+
+
+keyword_classifier = load_classifier()
@@ -1,25 +1,279 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
 import pytesseract
 from PIL import Image
 from IDModel import IDSample
+from Instrumentation import stage, OCR_CALLS
+from Config import setting
+
+try:
+    # Optional: tesserocr binds the Tesseract C++ API directly, so models stay loaded between calls
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+ARABIC_LANG = setting('ArabicLang', 'IDEXTRACTOR_ARABIC_LANG', 'ara-amiri-3000')
+NUMBERS_LANG = setting('NumbersLang', 'IDEXTRACTOR_NUMBERS_LANG', 'ara_number')
+PSM_AUTO = 3
+PSM_SINGLE_BLOCK = 6
+
+
+class TesseractPool:
+    """Keeps warm Tesseract API handles, at most `size` per (lang, psm, configs) combination."""
+
+    def __init__(self, size=2, tessdata_path=None):
+        self.size = size
+        self.tessdata_path = tessdata_path
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._created = {}
+
+    def _create_api(self, lang, psm, configs):
+        kwargs = {'lang': lang, 'psm': psm, 'configs': list(configs)}
+        if self.tessdata_path:
+            kwargs['path'] = self.tessdata_path
+        return tesserocr.PyTessBaseAPI(**kwargs)
+
+    @contextmanager
+    def acquire(self, lang, psm, configs=()):
+        key = (lang, psm, tuple(configs))
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.LifoQueue())
+            create = idle.empty() and self._created.get(key, 0) < self.size
+            if create:
+                self._created[key] = self._created.get(key, 0) + 1
+        if create:
+            try:
+                api = self._create_api(lang, psm, configs)
+            except Exception:
+                with self._lock:
+                    self._created[key] -= 1
+                raise
+        else:
+            # Block until another thread hands its handle back
+            api = idle.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            idle.put(api)
+
+    def _set_image(self, api, image):
+        pixels = np.ascontiguousarray(image, dtype=np.uint8)
+        if pixels.ndim == 3:
+            # OpenCV hands us BGR, Tesseract expects RGB
+            pixels = np.ascontiguousarray(pixels[:, :, ::-1])
+        height, width = pixels.shape[:2]
+        bytes_per_pixel = 1 if pixels.ndim == 2 else pixels.shape[2]
+        api.SetImageBytes(pixels.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+
+    def image_to_string(self, image, lang, psm=PSM_AUTO, configs=()):
+        with self.acquire(lang, psm, configs) as api:
+            self._set_image(api, image)
+            return api.GetUTF8Text()
+
+    def image_to_tsv(self, image, lang, psm=PSM_AUTO, configs=()):
+        with self.acquire(lang, psm, configs) as api:
+            self._set_image(api, image)
+            return api.GetTSVText(0)
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                while not idle.empty():
+                    idle.get_nowait().End()
+            self._idle.clear()
+            self._created.clear()
+
+
+TSV_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+WORD_LEVEL = 5
+
+
+def parse_tsv(tsv):
+    """Turn Tesseract TSV output (no header row) into the column dict image_to_data returns."""
+    data = {column: [] for column in TSV_COLUMNS}
+    for row in tsv.splitlines():
+        values = row.split('\t')
+        if len(values) < len(TSV_COLUMNS) - 1:
+            continue
+        values += [''] * (len(TSV_COLUMNS) - len(values))
+        for column, value in zip(TSV_COLUMNS, values):
+            data[column].append(value)
+    return data
+
+
+def words_from_data(data):
+    """Recognised words with their box (pixels, relative to the OCR'd image), confidence and line."""
+    words = []
+    for i in range(len(data['text'])):
+        text = str(data['text'][i]).strip()
+        if int(data['level'][i]) != WORD_LEVEL or not text:
+            continue
+        words.append({
+            'text': text,
+            'left': int(data['left'][i]),
+            'top': int(data['top'][i]),
+            'width': int(data['width'][i]),
+            'height': int(data['height'][i]),
+            'conf': float(data['conf'][i]),
+            'line': (int(data['block_num'][i]), int(data['par_num'][i]), int(data['line_num'][i])),
+        })
+    return words
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_shared_pool():
+    """Process-wide pool, or None when tesserocr is not installed (pytesseract is used instead)."""
+    global _shared_pool
+    if tesserocr is None:
+        return None
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            size = int(setting("OCRPoolSize", "IDEXTRACTOR_OCR_POOL_SIZE", os.cpu_count() or 2))
+            _shared_pool = TesseractPool(size=size, tessdata_path=os.environ.get("TESSDATA_PREFIX"))
+        return _shared_pool
+
+
+def preload_models():
+    """Load the Arabic and number traineddata into the shared pool now rather than on the first card.
+    Worker processes call this once at start-up; without tesserocr there is nothing to keep loaded."""
+    pool = get_shared_pool()
+    if pool is None:
+        return
+    for lang, psm, configs in ((ARABIC_LANG, PSM_AUTO, ()), (NUMBERS_LANG, PSM_SINGLE_BLOCK, ('digits',))):
+        with pool.acquire(lang, psm, configs):
+            pass
+
 
 class OCREngine:
     pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else get_shared_pool()
+
     def extract_arabic_text(self, image):
-        text = pytesseract.image_to_string(image, lang='ara-amiri-3000')    
+        if self.pool is not None:
+            return self.pool.image_to_string(image, ARABIC_LANG, PSM_AUTO)
+        text = pytesseract.image_to_string(image, lang=ARABIC_LANG)
         return text
     def extract_arabic_textFromImagPath(self, image_path):
         # Load the image
         image = Image.open(image_path)
-        text = pytesseract.image_to_string(image, lang='ara-amiri-3000')    
+        if self.pool is not None:
+            return self.pool.image_to_string(np.asarray(image.convert('L')), ARABIC_LANG, PSM_AUTO)
+        text = pytesseract.image_to_string(image, lang=ARABIC_LANG)
         return text
     def extract_numbers(self,image):
         # Perform OCR on the image
-        numbers = pytesseract.image_to_string(image, lang='ara_number', config='--psm 6 outputbase digits')  
+        if self.pool is not None:
+            return self.pool.image_to_string(image, NUMBERS_LANG, PSM_SINGLE_BLOCK, configs=('digits',))
+        numbers = pytesseract.image_to_string(image, lang=NUMBERS_LANG, config='--psm 6 outputbase digits')
         return numbers
+    def extract_arabic_words(self, image):
+        # One pass over a whole card side: word boxes and confidences instead of plain text
+        if self.pool is not None:
+            return words_from_data(parse_tsv(self.pool.image_to_tsv(image, ARABIC_LANG, PSM_AUTO)))
+        return words_from_data(pytesseract.image_to_data(image, lang=ARABIC_LANG, output_type=pytesseract.Output.DICT))
+    def extract_number_words(self, image):
+        if self.pool is not None:
+            return words_from_data(parse_tsv(self.pool.image_to_tsv(image, NUMBERS_LANG, PSM_SINGLE_BLOCK, configs=('digits',))))
+        return words_from_data(pytesseract.image_to_data(image, lang=NUMBERS_LANG, config='--psm 6 outputbase digits',
+                                                         output_type=pytesseract.Output.DICT))
     def extract_numbersFromImagePath(self,image_path):
         # Load the image
-        image = Image.open(image_path)    
+        image = Image.open(image_path)
         # Perform OCR on the image
-        numbers = pytesseract.image_to_string(image, lang='ara_number', config='--psm 6 outputbase digits')  
-        return numbers
\ No newline at end of file
+        if self.pool is not None:
+            return self.pool.image_to_string(np.asarray(image.convert('L')), NUMBERS_LANG, PSM_SINGLE_BLOCK, configs=('digits',))
+        numbers = pytesseract.image_to_string(image, lang=NUMBERS_LANG, config='--psm 6 outputbase digits')
+        return numbers
+
+
+_worker_engine = None
+
+
+def run_field_ocr(kind, image, field=None):
+    """Executor entry point: OCR one field crop. Module-level so it also works in a process pool."""
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = OCREngine()
+    with stage("ocr." + (field or kind)):
+        if kind == 'numbers':
+            return _worker_engine.extract_numbers(image)
+        if kind == 'arabic_words':
+            return _worker_engine.extract_arabic_words(image)
+        if kind == 'number_words':
+            return _worker_engine.extract_number_words(image)
+        return _worker_engine.extract_arabic_text(image)
+
+
+_field_executor = None
+_field_executor_lock = threading.Lock()
+
+
+def get_field_executor():
+    """Shared executor for field OCR (IDEXTRACTOR_FIELD_EXECUTOR=thread|process, IDEXTRACTOR_FIELD_WORKERS=N).
+    Returns None when IDEXTRACTOR_FIELD_WORKERS=0, in which case fields are OCR'd serially."""
+    global _field_executor
+    with _field_executor_lock:
+        if _field_executor is None:
+            workers = int(setting("FieldWorkers", "IDEXTRACTOR_FIELD_WORKERS", os.cpu_count() or 4))
+            if workers <= 0:
+                return None
+            if setting("FieldExecutor", "IDEXTRACTOR_FIELD_EXECUTOR", "thread") == "process":
+                _field_executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                _field_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="field-ocr")
+        return _field_executor
+
+
+class FieldOCRJobs:
+    """Submits the field OCR jobs of one card to the shared executor, with at most
+    `max_in_flight` of them running at once so a single card cannot starve the others."""
+
+    def __init__(self, executor=None, max_in_flight=None):
+        self.executor = executor if executor is not None else get_field_executor()
+        if max_in_flight is None:
+            max_in_flight = int(setting("FieldConcurrency", "IDEXTRACTOR_FIELD_CONCURRENCY", "4"))
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self.submitted = 0
+
+    def submit(self, kind, image, field=None):
+        self.submitted += 1
+        OCR_CALLS.inc(field=field or kind)
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(run_field_ocr(kind, image, field))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._slots.acquire()
+        try:
+            future = self.executor.submit(run_field_ocr, kind, image, field)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def arabic(self, image, field=None):
+        return self.submit('arabic', image, field)
+
+    def numbers(self, image, field=None):
+        return self.submit('numbers', image, field)
+
+    def arabic_words(self, image, field=None):
+        return self.submit('arabic_words', image, field)
+
+    def number_words(self, image, field=None):
+        return self.submit('number_words', image, field)
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import uuid
+import cv2
+
+
+class RequestContext:
+    """Per-request working state. Nothing is shared between requests: images stay in memory and,
+    when debug dumping is on, intermediate files go to a private directory instead of the CWD."""
+
+    def __init__(self, debug_dump=False, debug_root=None):
+        self.request_id = uuid.uuid4().hex
+        self.debug_dump = debug_dump
+        self.work_dir = None
+        if debug_dump:
+            debug_root = debug_root or os.path.join(os.getcwd(), "debug")
+            os.makedirs(debug_root, exist_ok=True)
+            self.work_dir = tempfile.mkdtemp(prefix=self.request_id + "-", dir=debug_root)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def dump_image(self, name, image):
+        if self.work_dir is None:
+            return
+        cv2.imwrite(self.path(name), image)
+
+    def dump_text(self, name, text):
+        if self.work_dir is None:
+            return
+        # utf-8 for the Arabic OCR output
+        with open(self.path(name), 'w', encoding='utf-8') as file:
+            file.write(text)
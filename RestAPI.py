@@ -1,84 +1,121 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
-from IDCroper  import CardExtractor
-from  DBHelper import SQLDatabase
-import os,threading,time
+from CardPipeline import ProcessCard, OutputSettings
+from  DBHelper import create_storage, StorageClosedError
+from Instrumentation import stage, metrics, HTTP_REQUESTS
+from ResultCache import ResultCache, ImageStore
+from JobQueue import JobQueue, QueueFullError
+from ScannerWatcher import ScannerWatcher
+from ImageArchive import ImageArchive
+from Config import server_config, setting, section as config_section, validate as validate_config
+import os,threading
 import json
-import queue
-import uuid
+import copy
+import zipfile
+import io
+import mmap
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+def MaxUploadBytes():
+    # Uploads larger than this are refused with 413 before their body is read (IDEXTRACTOR_MAX_UPLOAD_MB)
+    return int(float(setting("MaxUploadMB", "IDEXTRACTOR_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+
+def UploadMemoryBytes():
+    # Uploads up to this size are buffered in memory, larger ones are spooled to a temp file and memory-mapped
+    return int(float(setting("UploadMemoryMB", "IDEXTRACTOR_UPLOAD_MEMORY_MB", "2")) * 1024 * 1024)
+
+class UploadRequest(Request):
+    @property
+    def max_content_length(self):
+        # Batches stream through many cards: IterBatchItems bounds each card (and zip entry) instead
+        if self.endpoint == 'recognize_batch':
+            return None
+        return MaxUploadBytes()
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # A plain BytesIO or a real temp file (instead of Werkzeug's SpooledTemporaryFile), so
+        # DecodeUpload can hand OpenCV the uploaded bytes without copying them into a bytes object
+        if total_content_length is not None and total_content_length <= UploadMemoryBytes():
+            return io.BytesIO()
+        return tempfile.TemporaryFile('w+b')
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 CORS(app)  # Enable CORS for all routes
 
-def preprocess_image(card_image,char,scantype,tresh):
-     # Convert the image to grayscale
-    tresh=int(tresh)
-    gray = cv2.cvtColor(card_image, cv2.COLOR_BGR2GRAY) 
-    _, thresh = cv2.threshold(gray, tresh, 255, cv2.THRESH_BINARY_INV + cv2.ADAPTIVE_THRESH_MEAN_C)
-    final_image = cv2.bitwise_not(thresh)
- 
-    return final_image
-
-def CropIDFromScannerImage(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    binary = cv2.bitwise_not(gray)
-
-    (contours, _) = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-
-    max_area = 0
-    max_contour = None
-
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > max_area:
-            max_area = area
-            max_contour = contour
-
-    if max_contour is not None:
-        (x, y, w, h) = cv2.boundingRect(max_contour)
-        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        
-        cropped_image = image[y:y + h, x:x + w]
-        cv2.imwrite('detected_card.jpg', image)
-        cv2.imwrite('cropped_id_card.jpg', cropped_image)
-        
-        return cropped_image
-    else:
-        print("No contours found.")
+# Identical resubmissions are answered from here (IDEXTRACTOR_CACHE_MB=0 turns it off)
+CACHE_MB = float(setting("CacheMB", "IDEXTRACTOR_CACHE_MB", "64"))
+result_cache = ResultCache(CACHE_MB, setting("CacheDiskPath", "IDEXTRACTOR_CACHE_DISK_PATH")) if CACHE_MB > 0 else None
+
+# Card images returned by reference (?image=ref) are served from /images/<hash>
+image_store = ImageStore(float(setting("ImageStoreMB", "IDEXTRACTOR_IMAGE_STORE_MB", "128")))
+
+def ResponseOptionsFromRequest():
+    return ResponseOptionsFromArgs(request.args)
+
+def ResponseOptionsFromArgs(args):
+    # ?image=full|scaled|none|ref&max_width=<px>&quality=<1-100>
+    options = {}
+    mode = args.get('image')
+    if mode:
+        if mode not in ('full', 'scaled', 'none', 'ref'):
+            raise ValueError("image must be one of full, scaled, none, ref")
+        options['image'] = mode
+    if args.get('max_width'):
+        try:
+            max_width = int(args['max_width'])
+        except ValueError:
+            raise ValueError("max_width must be a positive integer")
+        if max_width < 1:
+            raise ValueError("max_width must be a positive integer")
+        options['max_width'] = max_width
+    if args.get('quality'):
+        try:
+            options['quality'] = min(max(int(args['quality']), 1), 100)
+        except ValueError:
+            raise ValueError("quality must be an integer between 1 and 100")
+    return options
+
+def ResultCacheKey(image,char,scantype,tresh,options=None):
+    # ?image=ref results are never cached: their URLs point into the bounded, in-memory image store,
+    # which may have evicted the image (or been emptied by a restart the disk tier survived)
+    if result_cache is None or (options or {}).get('image') == 'ref':
+        return None
+    return ResultCache.key(image, char, int(tresh), scantype, options, OutputSettings())
+
+def ExtractCard(image,char,scantype,tresh,context=None,options=None):
+        if image is None:
+            raise ValueError("Could not decode the image.")
+        key = ResultCacheKey(image,char,scantype,tresh,options)
+        if key is None:
+            return ProcessCard(image,char,scantype,tresh,context,options,image_store)
+        jsonstring = result_cache.get(key)
+        if jsonstring is None:
+            jsonstring = ProcessCard(image,char,scantype,tresh,context,options,image_store)
+            result_cache.put(key, jsonstring)
+        return jsonstring
+
+def DecodeUpload(image_file):
+    # Decode straight from the upload's buffer (or a read-only mapping of its temp file)
+    stream = image_file.stream
+    if isinstance(stream, io.BytesIO):
+        with stream.getbuffer() as buffer:
+            return cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return cv2.imdecode(np.frombuffer(stream.read(), np.uint8), cv2.IMREAD_COLOR)
+    if os.fstat(fileno).st_size == 0:
         return None
+    with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+        return cv2.imdecode(np.frombuffer(mapped, np.uint8), cv2.IMREAD_COLOR)
 
-def BeginProcessing(image,char,scantype,tresh):
+def BeginProcessing(image,char,scantype,tresh,context=None,options=None):
     try:
-     # Detect the card in the input image
-        if scantype == "Scanner":
-             card = CropIDFromScannerImage(image)
-        else:
-             card = CropIDFromScannerImage(image)    # we now not support webcam or camera images  : TODO
-        # Save the detected card as a new image
-        if char == 'F':
-         cv2.imwrite('Frontdetected_card.jpg', card)
-         cv2.imwrite('FrontOriginal.jpg', image)
-        elif char == 'B':
-         cv2.imwrite('Backdetected_card.jpg', card)
-         cv2.imwrite('BackOriginal.jpg', image)
-        else:
-            raise ValueError("Invalid character provided. Please provide 'F' for front ID data or 'B' for back ID data.")    
-        print("Card detected")
-        processed=preprocess_image(card,char,scantype,tresh)
-        print("processed")
-        cv2.imwrite('processd_id.jpg', processed)
-        IDExtractor= CardExtractor(processed,card)
-        print("IDExtractor" +char)
-        if char=='F':
-            jsonstring=IDExtractor.getFront_IDData()
-        elif char=='B':
-            jsonstring=IDExtractor.getBack_IDData()   
-        else:
-            raise ValueError("Invalid character provided. Please provide 'F' for front ID data or 'B' for back ID data.")      
-        
-        return jsonstring, 200
+        return ExtractCard(image,char,scantype,tresh,context,options), 200
     except Exception as e:
         print("Error", str(e))
         return jsonify({'error': str(e)}), 500
@@ -89,21 +126,190 @@ def recognize_text(char, threshold):
     if 'image' not in request.files:
         return jsonify({'error': 'No image sent'}), 400
     image_file = request.files['image']   
+    try:
+        options = ResponseOptionsFromRequest()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         # Read the image file directly using OpenCV
-        image = cv2.imdecode(np.frombuffer(image_file.read(), np.uint8), cv2.IMREAD_COLOR)
-        retMessage = BeginProcessing(image, char, "Image", threshold)   
-        SaveImageToSavingDir(image)
+        image = DecodeUpload(image_file)
+        retMessage = BeginProcessing(image, char, "Image", threshold, options=options)   
+        image = None
+        SaveOriginalToSavingDir(UploadBytes(image_file), image_file.filename)
         return retMessage
     except Exception as e:
         print("Error", str(e))
         return jsonify({'error': str(e)}), 500
 
+
+BATCH_WORKERS = int(setting("BatchWorkers", "IDEXTRACTOR_BATCH_WORKERS", os.cpu_count() or 4))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+def StreamSize(stream):
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+def DetachBatchUploads(files, char):
+    """(field, filename, side, stream) for every part of a batch upload. The streams are taken over
+    from the request's FileStorage objects, which Werkzeug closes when the request ends (before a
+    streamed response is consumed, depending on the version); the caller closes them."""
+    uploads = []
+    for field, side in (('front', 'F'), ('back', 'B'), ('images', char), ('archive', char)):
+        for image_file in files.getlist(field):
+            uploads.append((field, image_file.filename, side, image_file.stream))
+            image_file.stream = io.BytesIO()
+    return uploads
+
+def TooLargeError(size, max_bytes):
+    return f"Image too large ({size} bytes), the limit is {max_bytes // (1024 * 1024)} MB per card"
+
+def IterBatchItems(uploads, char):
+    """Yield (name, side, bytes, error) for every image in the DetachBatchUploads() list. Multipart fields
+    'front', 'back' and 'images' (side taken from the URL) may repeat; an 'archive' zip may hold front/
+    and back/ folders. Items over MaxUploadBytes() are not read: they come back with bytes None and an error."""
+    max_bytes = MaxUploadBytes()
+    for field, filename, side, stream in uploads:
+        if field != 'archive':
+            size = StreamSize(stream)
+            if size > max_bytes:
+                yield filename, side, None, TooLargeError(size, max_bytes)
+            else:
+                yield filename, side, stream.read(), None
+            continue
+        with zipfile.ZipFile(stream) as archive:
+            for entry in archive.infolist():
+                if entry.is_dir():
+                    continue
+                folders = [part.lower() for part in entry.filename.split('/')[:-1]]
+                if 'front' in folders:
+                    side = 'F'
+                elif 'back' in folders:
+                    side = 'B'
+                else:
+                    side = char
+                if entry.file_size > max_bytes:
+                    yield entry.filename, side, None, TooLargeError(entry.file_size, max_bytes)
+                    continue
+                # Never inflate more than the limit, whatever size the entry header claims
+                try:
+                    with archive.open(entry) as entry_file:
+                        data = entry_file.read(max_bytes + 1)
+                except (zipfile.BadZipFile, OSError, NotImplementedError) as e:
+                    yield entry.filename, side, None, str(e)
+                    continue
+                if len(data) > max_bytes:
+                    yield entry.filename, side, None, TooLargeError(len(data), max_bytes)
+                else:
+                    yield entry.filename, side, data, None
+
+def ProcessBatchItem(index, name, side, data, threshold, options):
+    # Errors are reported per card so one bad scan does not fail the whole batch
+    try:
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        result = json.loads(ExtractCard(image, side, "Image", threshold, options=options))
+        SaveOriginalToSavingDir(data, name)
+        return {'index': index, 'name': name, 'side': side, 'result': result}
+    except Exception as e:
+        print("Error", name, str(e))
+        return {'index': index, 'name': name, 'side': side, 'error': str(e)}
+
+@app.route('/recognize-batch/<char>/<int:threshold>', methods=['POST'])
+def recognize_batch(char, threshold):
+    if not any(field in request.files for field in ('front', 'back', 'images', 'archive')):
+        return jsonify({'error': 'No images sent'}), 400
+    try:
+        options = ResponseOptionsFromRequest()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Taken before returning: the generator runs after the view, when the request's files may be closed
+    uploads = DetachBatchUploads(request.files, char)
+
+    def generate():
+        # Keep a bounded window of cards in flight and stream each result as soon as it finishes
+        pending = set()
+        try:
+            for index, (name, side, data, error) in enumerate(IterBatchItems(uploads, char)):
+                if error is not None:
+                    yield json.dumps({'index': index, 'name': name, 'side': side, 'error': error}) + '\n'
+                    continue
+                pending.add(batch_executor.submit(ProcessBatchItem, index, name, side, data, threshold, options))
+                if len(pending) >= BATCH_WORKERS * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield json.dumps(future.result()) + '\n'
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield json.dumps(future.result()) + '\n'
+        finally:
+            for _, _, _, stream in uploads:
+                stream.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+job_queue = JobQueue(
+    workers=int(setting("JobWorkers", "IDEXTRACTOR_JOB_WORKERS", os.cpu_count() or 2)),
+    max_queued=int(setting("JobQueueSize", "IDEXTRACTOR_JOB_QUEUE_SIZE", "100")),
+    max_finished=int(setting("JobResultsKept", "IDEXTRACTOR_JOB_RESULTS_KEPT", "1000")),
+)
+# Upper bound for ?wait= long-polling so a client cannot hold a server thread forever
+MAX_JOB_WAIT = 30
+
+def RunExtractionJob(data, char, threshold, options):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    result = json.loads(ExtractCard(image, char, "Image", threshold, options=options))
+    SaveOriginalToSavingDir(data)
+    return result
+
+def GetWaitSeconds():
+    try:
+        return min(max(float(request.args.get('wait', 0)), 0), MAX_JOB_WAIT)
+    except ValueError:
+        return 0
+
+@app.route('/jobs/<char>/<int:threshold>', methods=['POST'])
+def submit_job(char, threshold):
+    if 'image' not in request.files:
+        return jsonify({'error': 'No image sent'}), 400
+    if char not in ('F', 'B'):
+        return jsonify({'error': "Invalid character provided. Please provide 'F' or 'B'."}), 400
+    try:
+        options = ResponseOptionsFromRequest()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        job = job_queue.submit(RunExtractionJob, request.files['image'].read(), char, threshold, options)
+    except QueueFullError as e:
+        # Backpressure: the client should retry later instead of piling more work on the server
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    return jsonify(job.to_dict()), 202, {'Location': f"/jobs/{job.id}"}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.wait(job_id, GetWaitSeconds())
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_queue.wait(job_id, GetWaitSeconds())
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    if job.status == 'done':
+        return jsonify(job.result), 200
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    return jsonify(job.to_dict()), 202
+
     
 @app.route('/save', methods=['POST'])
 def save_to_database():
     try:
-        # Extract JSON data from the request
+        # Extract JSON data from the request (a single record or a list of records)
         record = request.get_json()  
         # Call the SaveTODataBase function
         success, message = SaveTODataBase(record)     
@@ -114,80 +320,121 @@ def save_to_database():
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 500    
-def SaveImageToSavingDir(image):
-    try:
-        config_result = ReadConfig()
-        if config_result is None:
-            print("Warning: Config file not found. Skipping image save.")
-            return
-        savepath, b, f = config_result
-        # Generate a GUID
-        image_name = str(uuid.uuid4()) + '.jpg'
-        # Define the path
-        path = os.path.join(savepath, image_name)
-        # Save the image
-        cv2.imwrite(path, image)
-        print(f"Image saved to: {path}")
-    except Exception as e:
-        print(f"Error saving image: {str(e)}")
-        # Don't fail the whole request if image saving fails
+# Scans are archived to the configured SavePath by a background writer, off the request path
+image_archive = ImageArchive(lambda: (ReadConfig() or (None,))[0],
+                             max_queued=int(setting("ArchiveQueueSize", "IDEXTRACTOR_ARCHIVE_QUEUE_SIZE", "256")),
+                             enqueue_timeout=float(setting("ArchiveEnqueueTimeout", "IDEXTRACTOR_ARCHIVE_ENQUEUE_TIMEOUT", "5")))
+metrics.gauge('idextractor_archive_queue_depth', 'Scans waiting to be written to the archive.', image_archive.depth)
+
+def SaveOriginalToSavingDir(data, filename=None):
+    # Preferred: the bytes exactly as uploaded, nothing is decoded or re-encoded
+    image_archive.submit_bytes(data, filename)
+
+def UploadBytes(image_file):
+    stream = image_file.stream
+    if isinstance(stream, io.BytesIO):
+        return stream.getvalue()
+    stream.seek(0)
+    return stream.read()
+
+storage = None
+storage_settings = None
+storage_lock = threading.Lock()
+
+def GetStorage():
+    # One backend per process, rebuilt only when the "Storage" config section changes
+    global storage, storage_settings
+    settings = ReadStorageConfig()
+    with storage_lock:
+        if storage is None or settings != storage_settings:
+            if storage is not None:
+                storage.close()
+            storage = create_storage(settings)
+            storage_settings = settings
+        return storage
 
 def SaveTODataBase(record):
+    # `record` is one record dict, or a list of them for a batch save
+    records = record if isinstance(record, list) else [record]
+    if not records:
+        return False, "No records to save"
     try:
-        # Get database connection parameters from environment variables
-        server = r"AMRO-PC\SQLEXPRESS"  # The 'r' before the string allows backslashes to be used as literal characters
-        database = "IDExteactor"
-        print("database")
-
-        # Initialize SQLDatabase object
-        db = SQLDatabase(
-            server=server,
-            database=database
-        )      
-
-        # Check if database connection is already established
-        if not db.connection:
-            # Connect to the database
-            db.connect()
-
-        # Check if the database exists
-        if not db.database_exists():
-            # Create the database (ensure this method is implemented if needed)
-            # db.create_database(database)
-            raise NotImplementedError("create_database method is not implemented.")
-
-        print("All before creating table")
-        # Check if table exists
-        table_name = 'dbo.IDSamples'  # Adjust table name accordingly
-        if not db.table_exists(table_name):
-            # Create a table (assuming record provides column names and data types)
-            columns = {col: 'VARCHAR(MAX)' for col in record.keys()}  # Example: Adjust data types as needed
-            print(f"Creating table {table_name} with columns: {columns}")
-            db.create_table(table_name, columns)
-            print(f"Table {table_name} created successfully.")
-
-        # Insert record
-        print("Inserting record:", record)
-        db.insert_record(table_name, record)
-        print("Record inserted successfully.")
-
+        with stage("db.insert"):
+            try:
+                GetStorage().save_records('IDSamples', records)
+            except StorageClosedError:
+                # The backend was swapped for a new config while we held it; nothing was written
+                GetStorage().save_records('IDSamples', records)
+        print(f"{len(records)} record(s) inserted successfully.")
         return True, "Data saved successfully"
     except Exception as e:
         print(e)
         return False, str(e)
 
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({'error': f"Upload too large, the limit is {MaxUploadBytes() // (1024 * 1024)} MB"}), 413
+
 @app.route('/')
 def home():
     return "OCR Server is running..."
 
-@app.route('/check-file', methods=['POST'])
-def check_file():
+@app.route('/images/<image_hash>', methods=['GET'])
+def get_image(image_hash):
+    if request.headers.get('If-None-Match', '').strip('"') == image_hash:
+        return Response(status=304)
+    data = image_store.get(image_hash)
+    if data is None:
+        return jsonify({'error': 'Image not found'}), 404
+    # Content-addressed: the bytes behind a hash never change, so clients may cache them forever
+    return Response(data, mimetype='image/jpeg', headers={
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'ETag': f'"{image_hash}"',
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus text exposition format
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.after_request
+def count_request(response):
+    HTTP_REQUESTS.inc(endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+def ResolveScanDirectory(side):
+    # Errors come back as (body, status) so both the Flask and the ASGI app can use this
     config_result = ReadConfig()
     if config_result is None:
-        return jsonify({'error': 'Configuration file not found. Please set up configuration first.'}), 400
-    
+        return None, ({'error': 'Configuration file not found. Please set up configuration first.'}, 400)
     savepath, backpath, frontpath = config_result
+    if side == 'F':
+        directory_path = frontpath
+    elif side =='B':
+        directory_path=backpath  
+    else:
+        directory_path = ""
+    if not directory_path or not os.path.isabs(directory_path):
+        print("Directory path must be absolute")
+        return None, ({'error': 'Directory path must be absolute'}, 400)
+    return directory_path, None
+
+def ParseThreshold(value):
+    # Thresholds reach the watcher from JSON bodies and query strings; only whole numbers are valid
+    if value is None or isinstance(value, bool):
+        raise ValueError("treshold must be an integer")
+    try:
+        threshold = int(str(value).strip())
+    except ValueError:
+        raise ValueError("treshold must be an integer")
+    # Same range as the <int:threshold> of the upload routes
+    if threshold < 0:
+        raise ValueError("treshold must not be negative")
+    return threshold
+
+@app.route('/check-file', methods=['POST'])
+def check_file():
     data = request.data.decode('utf-8')
     print("Data received:", data)  # Add this line to print the received data
     try:
@@ -200,65 +447,83 @@ def check_file():
         print("no data found")
         return jsonify({'error': 'the side is not provided in the request body'}), 400
     side=data_dict['side']
-    if side == 'F':
-        directory_path = frontpath
-    elif side =='B':
-        directory_path=backpath  
-    else:
-        directory_path = ""
-    tresh=data_dict['treshold']
-    print(tresh)
-    if not os.path.isabs(directory_path):
-        print("Directory path must be absolute")
-        return jsonify({'error': 'Directory path must be absolute'}), 400
+    directory_path, error = ResolveScanDirectory(side)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    try:
+        tresh=ParseThreshold(data_dict.get('treshold'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     if not os.path.exists(directory_path):
         return jsonify({'file_found': False}), 200
-    # Create a queue to store the result from the thread
-    result_queue = queue.Queue()
-    # Start a new thread to check for file presence
-    thread = threading.Thread(target=check_file_presence, args=(directory_path,side,tresh,result_queue))
-    thread.start()
-    print("thread started")
-    thread.join()
-    print("thread finished")
-    # Check if there's a result in the queue
-    if not result_queue.empty():     
-        result = result_queue.get()
-        
-        return result[0], result[1]
-    else:
-        return jsonify({'thread_started': True, 'result': "No result from thread"}), 200
-
- #Function to check for the presence of the  scanner image in a specific path 
-def check_file_presence(dirpath, char,tresh, result_queue):
-    timeout = 10  # Timeout in seconds
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        if os.path.exists(dirpath):
-            files = os.listdir(dirpath)
-            if len(files) >0:
-                file_path = os.path.join(dirpath, files[0])
-                if os.path.isfile(file_path):
-                    print("File found: " + file_path)
-                    # Pass the file path to the other function for processing
-                    image = cv2.imread(file_path, cv2.IMREAD_ANYCOLOR)
-                    print(tresh)
-                    retMesage=BeginProcessing(image,char,"Scanner",tresh)   
-                    result_queue.put(retMesage)
-                    os.remove(file_path)
-                    SaveImageToSavingDir(image)
-                    return retMesage
-        print("Waiting for directory to be created: " + dirpath)
-        time.sleep(1)  # Check every 1 second
-    result_queue.put("Error checking directory")
-    return "Error checking directory"
+    # The watcher processes files as soon as they land; we only wait for its result
+    scanner_watcher.ensure_watching(side, directory_path, tresh)
+    result = scanner_watcher.wait_result(side, timeout=CHECK_FILE_TIMEOUT)
+    if result is None:
+        return jsonify({'file_found': False}), 200
+    return result[0], result[1]
+
+@app.route('/check-file/events/<side>', methods=['GET'])
+def check_file_events(side):
+    # Server-sent events: push every scanned card for this side to the client as it is processed
+    directory_path, error = ResolveScanDirectory(side)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    # Optional: without it the threshold of the side's last /check-file is kept
+    tresh = request.args.get('treshold', request.args.get('threshold'))
+    try:
+        tresh = ParseThreshold(tresh) if tresh is not None else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if tresh is None and scanner_watcher.threshold(side) is None:
+        return jsonify({'error': 'treshold is required until a /check-file has set one for this side'}), 400
+    if not os.path.exists(directory_path):
+        return jsonify({'file_found': False}), 200
+    scanner_watcher.ensure_watching(side, directory_path, tresh)
+
+    def generate():
+        for body, status in scanner_watcher.subscribe(side, timeout=SCANNER_EVENTS_IDLE_TIMEOUT):
+            event = 'result' if status == 200 else 'error'
+            yield f"event: {event}\ndata: {body}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+ #Function to process a scanner image once the watcher sees it in the Front/Back folder
+def ProcessScannedFile(file_path, char, tresh, extract=None):
+    # Read once: the same bytes are decoded here and archived as they are. `extract` replaces
+    # ExtractCard (the ASGI app hands the card to its worker processes)
+    extract = extract or ExtractCard
+    try:
+        with open(file_path, 'rb') as scanned_file:
+            data = scanned_file.read()
+    except OSError as e:
+        print("Error", str(e))
+        return json.dumps({'error': str(e)}), 500
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_ANYCOLOR) if data else None
+    try:
+        result = extract(image, char, "Scanner", tresh), 200
+    except Exception as e:
+        print("Error", str(e))
+        result = json.dumps({'error': str(e)}), 500
+    if image is not None:
+        SaveOriginalToSavingDir(data, file_path)
+    return result
+
+CHECK_FILE_TIMEOUT = 10  # Timeout in seconds
+SCANNER_EVENTS_IDLE_TIMEOUT = 300
+# A scanned card nobody asked for within this many seconds is dropped instead of going to the next client
+SCAN_RESULT_TTL = float(setting("ScanResultTTL", "IDEXTRACTOR_SCAN_RESULT_TTL", "60"))
+scanner_watcher = ScannerWatcher(ProcessScannedFile, result_ttl=SCAN_RESULT_TTL)
 
 @app.route('/save-config', methods=['POST'])
 def SaveConfig():
      # Get the JSON data from the POST request
-    config_data = request.get_json()
-    
+    body, status = WriteConfig(request.get_json())
+    return jsonify(body), status
+
+def WriteConfig(config_data):
     # Print received data for debugging
     print("Received config data:", config_data)
     
@@ -270,11 +535,8 @@ def SaveConfig():
     has_uppercase = all(key in config_data for key in required_fields_uppercase)
     
     if not (has_lowercase or has_uppercase):
-        return jsonify({"error": "Missing required configuration data."}), 400
+        return {"error": "Missing required configuration data."}, 400
 
-    # Define the path where the config file will be saved
-    config_file_path = os.path.join(os.getcwd(), "config.json")
-    
     # Retrieve paths from config data (handle both cases)
     if has_lowercase:
         savepath = config_data.get("savePath", "")
@@ -290,9 +552,14 @@ def SaveConfig():
         savepath = config_data.get("SavePath", "")
         backpath = config_data.get("BackPath", "")
         frontpath = config_data.get("FrontPath", "")
-    # Write the data to a JSON file
-    with open(config_file_path, 'w') as config_file:
-        json.dump(config_data, config_file, indent=4)
+    errors = validate_config(config_data)
+    if errors:
+        return {"error": "; ".join(errors)}, 400
+    # Keep any other sections (e.g. "Storage") that are already in the file
+    existing = ReadConfigFile() or {}
+    existing.update(config_data)
+    # Write the data to config.json; readers pick up the new settings immediately
+    server_config.write(existing)
  # Create directories if they don't exist
     if savepath:
         os.makedirs(savepath, exist_ok=True)
@@ -305,33 +572,24 @@ def SaveConfig():
     if frontpath:
         os.makedirs(frontpath, exist_ok=True)
         print(f"Front path created or exists: {frontpath}")
-    return jsonify({"message": "Configuration saved successfully."}), 200
+    return {"message": "Configuration saved successfully."}, 200
 
 
+def ReadConfigFile():
+    # Parsed once and cached; re-read only when config.json changes
+    if not server_config.exists():
+        return None
+    return copy.deepcopy(server_config.get())
+
+def ReadStorageConfig():
+    # Defaults to the SQL Server instance the app has always used
+    return config_section("Storage", {"Backend": "sqlserver"})
+
 def ReadConfig():
-    config_file_path = os.path.join(os.getcwd(), "config.json")
-    # Ensure the file exists
-    if os.path.exists(config_file_path):
-        try:
-            with open(config_file_path, 'r') as config_file:
-                # Load the JSON data from the file
-                config_data = json.load(config_file)
-            
-                # Extract the paths
-                savepath = config_data.get("SavePath")
-                backpath = config_data.get("BackPath")
-                frontpath = config_data.get("FrontPath")
-            
-                # Print the paths
-                print("Save Path:", savepath)
-                print("Back Path:", backpath)
-                print("Front Path:", frontpath)
-                return savepath, backpath, frontpath
-        except Exception as e:
-            print(f"Error reading config file: {str(e)}")
-            return None
-    else:
-        print("Config file does not exist!")
+    if not server_config.exists():
         return None
+    config_data = server_config.get()
+    return config_data.get("SavePath"), config_data.get("BackPath"), config_data.get("FrontPath")
 if __name__ == '__main__':
-    app.run(debug=False)
+    # Requests keep their working state in a RequestContext, so they can be served concurrently
+    app.run(debug=False, threaded=True)
@@ -0,0 +1,113 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from Instrumentation import CACHE_LOOKUPS
+
+
+class ResultCache:
+    """Extraction results keyed by a hash of the decoded image, side and threshold.
+    The memory tier is an LRU bounded to `max_mb`; the optional SQLite tier at `disk_path`
+    keeps up to `disk_max_entries` results across restarts."""
+
+    def __init__(self, max_mb=64, disk_path=None, disk_max_entries=10000):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, used REAL)")
+            self._disk.commit()
+
+    @staticmethod
+    def key(image, side, threshold, scantype, options=None, settings=None):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{side}|{threshold}|{scantype}|{image.shape}|{image.dtype}".encode())
+        # Response options change the payload (e.g. no image, or a scaled one), so they are part of the key
+        digest.update(repr(sorted((options or {}).items())).encode())
+        # So are the pipeline settings (OCR mode, binarization, resolution...) and the result format version
+        digest.update(repr(sorted((settings or {}).items())).encode())
+        digest.update(memoryview(image if image.flags['C_CONTIGUOUS'] else image.copy()).cast('B'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                CACHE_LOOKUPS.inc(result='hit', tier='memory')
+                return value
+            if self._disk is not None:
+                row = self._disk.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._disk.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+                    self._disk.commit()
+                    self._remember(key, row[0])
+                    CACHE_LOOKUPS.inc(result='hit', tier='disk')
+                    return row[0]
+        CACHE_LOOKUPS.inc(result='miss', tier='all')
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+            if self._disk is not None:
+                self._disk.execute("INSERT OR REPLACE INTO results (key, value, used) VALUES (?, ?, ?)",
+                                   (key, value, time.time()))
+                self._disk.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,))
+                self._disk.commit()
+
+    def _remember(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+
+class ImageStore:
+    """Content-addressed store for encoded card images served from /images/<hash>.
+    Bounded LRU: the oldest images are dropped once `max_mb` is exceeded."""
+
+    def __init__(self, max_mb=128):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return key
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return key
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
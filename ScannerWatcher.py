@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Optional: watchdog uses inotify on Linux (ReadDirectoryChangesW on Windows, FSEvents on macOS)
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _ScannerEventHandler(FileSystemEventHandler):
+    def __init__(self, watcher, side):
+        self.watcher = watcher
+        self.side = side
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.file_arrived(self.side, event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.file_arrived(self.side, event.dest_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.file_arrived(self.side, event.src_path)
+
+
+class ScannerWatcher:
+    """Long-lived watcher for the scanner Front/Back folders. Each completed file is processed as
+    soon as it lands and its result is queued per side (oldest first) until a client takes it;
+    results nobody took within `result_ttl` seconds are discarded.
+
+    `process_file(path, side, threshold)` does the actual work and returns the response body and
+    status; the watcher deletes the file afterwards, like the old polling loop did. A file that is
+    still empty (or still growing) after `settle_timeout` seconds is skipped until it changes again."""
+
+    def __init__(self, process_file, settle_time=0.2, poll_interval=0.25, workers=2, settle_timeout=30.0,
+                 result_ttl=60.0):
+        self.process_file = process_file
+        self.settle_time = settle_time
+        self.settle_timeout = settle_timeout
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scanner")
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._directories = {}
+        self._thresholds = {}
+        self._observers = {}
+        self._in_progress = set()
+        # path -> (size, mtime) of files that never settled; picked up again only once they change
+        self._skipped = {}
+        # side -> deque of (produced_at, result); every result is handed to exactly one client
+        self._results = {}
+        self._poller = None
+        self._stopped = threading.Event()
+
+    def ensure_watching(self, side, directory, threshold=None):
+        """Watch `directory` for `side`. `threshold` replaces the side's threshold; None keeps it."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            if threshold is not None:
+                self._thresholds[side] = threshold
+            if self._directories.get(side) == directory:
+                return
+            self._directories[side] = directory
+            old_observer = self._observers.pop(side, None)
+            if Observer is not None:
+                observer = Observer()
+                observer.schedule(_ScannerEventHandler(self, side), directory, recursive=False)
+                observer.daemon = True
+                observer.start()
+                self._observers[side] = observer
+            elif self._poller is None:
+                # Polling fallback when watchdog is not installed
+                self._poller = threading.Thread(target=self._poll, name="scanner-poll", daemon=True)
+                self._poller.start()
+        if old_observer is not None:
+            old_observer.stop()
+        # Files that were already waiting before we started watching
+        self._scan(side, directory)
+
+    def threshold(self, side):
+        with self._lock:
+            return self._thresholds.get(side)
+
+    def file_arrived(self, side, path):
+        if self._stopped.is_set():
+            return
+        with self._lock:
+            if path in self._in_progress:
+                return
+            if path in self._skipped:
+                if self._skipped[path] == self._signature(path):
+                    return
+                del self._skipped[path]
+            self._in_progress.add(path)
+        self._executor.submit(self._handle, side, path)
+
+    def wait_result(self, side, timeout):
+        """Take the oldest queued result for `side`, blocking up to `timeout` seconds (None: no
+        limit) for one to arrive."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while True:
+                result = self._take(side)
+                if result is not None:
+                    return result
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def subscribe(self, side, timeout=None):
+        """Take results for `side` as they are produced (for server-sent events); stops after
+        `timeout` seconds without a new result. Results go to either a subscriber or a
+        wait_result() caller, never both."""
+        while True:
+            result = self.wait_result(side, timeout)
+            if result is None:
+                return
+            yield result
+
+    def stop(self, wait=False):
+        """Stop watching. With `wait`, return only once the files being processed are done (files
+        still settling are left in place for the next start)."""
+        self._stopped.set()
+        with self._lock:
+            observers = list(self._observers.values())
+            self._observers.clear()
+        for observer in observers:
+            observer.stop()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _take(self, side):
+        # Caller holds the lock
+        results = self._results.get(side)
+        if not results:
+            return None
+        expired_before = time.time() - self.result_ttl
+        while results and results[0][0] < expired_before:
+            results.popleft()
+            print(f"Discarding an unclaimed {side} scan result older than {self.result_ttl} seconds")
+        return results.popleft()[1] if results else None
+
+    def _scan(self, side, directory):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_file():
+                self.file_arrived(side, entry.path)
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                directories = list(self._directories.items())
+            for side, directory in directories:
+                self._scan(side, directory)
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _wait_until_written(self, path):
+        # The scanner may still be writing: wait until the size stops changing. An empty file (or one
+        # that keeps growing) gives up after settle_timeout instead of holding a worker forever.
+        deadline = time.time() + self.settle_timeout
+        last_size = -1
+        while True:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return False
+            if self._stopped.is_set():
+                return False
+            if size == last_size and size > 0:
+                return True
+            if time.time() >= deadline:
+                print(f"Skipping {path}: it did not settle within {self.settle_timeout} seconds (size {size})")
+                with self._lock:
+                    self._skipped[path] = self._signature(path)
+                return False
+            last_size = size
+            time.sleep(self.settle_time)
+
+    def _handle(self, side, path):
+        try:
+            if not self._wait_until_written(path):
+                return
+            print("File found: " + path)
+            with self._lock:
+                threshold = self._thresholds.get(side)
+            result = self.process_file(path, side, threshold)
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing scanned file: {str(e)}")
+            with self._changed:
+                self._results.setdefault(side, deque()).append((time.time(), result))
+                self._changed.notify_all()
+        except Exception as e:
+            print("Error", str(e))
+        finally:
+            with self._lock:
+                self._in_progress.discard(path)
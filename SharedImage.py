@@ -0,0 +1,32 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedImage:
+    """A decoded image copied once into a shared memory block, so a worker process can read it
+    in place instead of receiving it pickled through a pipe. The creating process owns the block
+    and must close() it once the worker is done."""
+
+    def __init__(self, image):
+        self._shm = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+        np.ndarray(image.shape, image.dtype, buffer=self._shm.buf)[...] = image
+        # Picklable handle the worker uses to attach
+        self.descriptor = (self._shm.name, image.shape, image.dtype.str)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_image(descriptor):
+    """Worker side: returns (block, array view). Drop every reference to the view before block.close()."""
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the extraction pipeline
+Runs the front/back sample scans through ExtractCard at several card resolutions and concurrency
+levels and writes latency percentiles, throughput, field accuracy and a per-stage breakdown to JSON
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import CardPipeline
+import Instrumentation
+import RestAPI
+from RestAPI import ExtractCard
+
+SAMPLES = {
+    'F': 'FrontOriginal.jpg',
+    'B': 'BackOriginal.jpg',
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else None,
+        'p50_ms': round(percentile(values, 50) * 1000, 3) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 3) if values else None,
+    }
+
+
+class StageCollector:
+    """Instrumentation sink that keeps every stage duration seen while it is registered."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def __call__(self, name, seconds):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+
+# Keys that carry images or pipeline metadata rather than extracted text; they are not compared for accuracy
+IMAGE_KEYS = ('image', 'face', 'image_url', 'face_url', 'fallbacks')
+
+
+def run_one(image, side, threshold):
+    # Each run gets its own copy, like a freshly decoded upload
+    start = time.perf_counter()
+    result = json.loads(ExtractCard(image.copy(), side, "Scanner", threshold))
+    return time.perf_counter() - start, {key: value for key, value in result.items() if key not in IMAGE_KEYS}
+
+
+def field_accuracy(outputs, expected):
+    """Share of extracted fields equal to the expected values, over all runs of a side."""
+    if not expected or not outputs:
+        return None
+    matches = total = 0
+    for output in outputs:
+        for key, value in expected.items():
+            total += 1
+            matches += output.get(key) == value
+    return round(matches / total, 4) if total else None
+
+
+def run_level(images, sides, iterations, concurrency, threshold, expected):
+    collector = StageCollector()
+    Instrumentation.add_sink(collector)
+    latencies = {side: [] for side in sides}
+    outputs = {side: [] for side in sides}
+    errors = []
+    jobs = [side for _ in range(iterations) for side in sides]
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [(side, executor.submit(run_one, images[side], side, threshold)) for side in jobs]
+            for side, future in futures:
+                try:
+                    latency, output = future.result()
+                    latencies[side].append(latency)
+                    outputs[side].append(output)
+                except Exception as e:
+                    errors.append(f"{side}: {e}")
+        elapsed = time.perf_counter() - start
+    finally:
+        Instrumentation.remove_sink(collector)
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        'target_dpi': CardPipeline.TargetDPI(),
+        'concurrency': concurrency,
+        'cards': completed,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'cards_per_sec': round(completed / elapsed, 3) if elapsed else None,
+        'latency': {side: summarize(values) for side, values in latencies.items()},
+        'field_accuracy': {side: field_accuracy(outputs[side], expected.get(side)) for side in sides},
+        'stages': {name: summarize(values) for name, values in sorted(collector.samples.items())},
+    }
+
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ID extraction pipeline on the bundled sample scans")
+    parser.add_argument('--iterations', type=int, default=10, help="cards per side at each concurrency level")
+    parser.add_argument('--concurrency', default='1,2,4', help="comma separated concurrency levels")
+    parser.add_argument('--sides', default='F,B', help="F, B or F,B")
+    parser.add_argument('--threshold', type=int, default=120)
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs per side before measuring")
+    parser.add_argument('--target-dpi', default='0', help="comma separated card resolutions to compare, 0 = no resampling")
+    parser.add_argument('--expected', help="JSON file with the correct fields per side, e.g. {\"F\": {\"ID\": ...}}; "
+                                           "defaults to the output of an unresampled run")
+    parser.add_argument('--with-cache', action='store_true', help="keep the result cache on (repeat runs become cache hits)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    sides = [side.strip().upper() for side in args.sides.split(',') if side.strip()]
+    images = {}
+    for side in sides:
+        image = cv2.imread(SAMPLES[side], cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"Sample image not found: {SAMPLES[side]}")
+            return 1
+        images[side] = image
+
+    if not args.with_cache:
+        RestAPI.result_cache = None
+
+    if args.expected:
+        with open(args.expected, encoding='utf-8') as expected_file:
+            expected = json.load(expected_file)
+    else:
+        # Reference: what the pipeline reads from the scan at its original resolution
+        os.environ['IDEXTRACTOR_TARGET_DPI'] = '0'
+        expected = {side: run_one(images[side], side, args.threshold)[1] for side in sides}
+
+    levels = []
+    for target_dpi in [float(dpi) for dpi in args.target_dpi.split(',')]:
+        os.environ['IDEXTRACTOR_TARGET_DPI'] = str(target_dpi)
+        for side in sides:
+            for _ in range(args.warmup):
+                run_one(images[side], side, args.threshold)
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            print(f"Running {args.iterations} iteration(s) per side at {target_dpi:g} DPI, concurrency {concurrency}...")
+            level = run_level(images, sides, args.iterations, concurrency, args.threshold, expected)
+            print(f"  {level['cards_per_sec']} cards/sec, {len(level['errors'])} error(s)")
+            for side, latency in level['latency'].items():
+                print(f"  {side}: p50={latency['p50_ms']}ms p95={latency['p95_ms']}ms p99={latency['p99_ms']}ms "
+                      f"accuracy={level['field_accuracy'][side]}")
+            levels.append(level)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': f"{platform.system()} {platform.release()}",
+        'cpu_count': os.cpu_count(),
+        'settings': {
+            'iterations': args.iterations,
+            'sides': sides,
+            'threshold': args.threshold,
+            'target_dpi': args.target_dpi,
+            'expected': args.expected,
+            'env': {key: value for key, value in os.environ.items() if key.startswith('IDEXTRACTOR_')},
+        },
+        'levels': levels,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Production launcher: one ASGI front process (AsyncAPI) plus N extraction worker processes.
+Workers are forked from a server that has already imported OpenCV and the OCR modules, load the
+Tesseract models once at start-up, and read decoded cards from shared memory.
+
+    python serve.py --workers 16 --port 5000
+"""
+
+import argparse
+import os
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the OCR server with a pool of extraction worker processes")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="extraction worker processes")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--shutdown-grace', type=float, default=30,
+                        help="seconds to wait for cards in flight on shutdown")
+    args = parser.parse_args()
+
+    # Read by AsyncAPI at import time
+    os.environ["IDEXTRACTOR_ASGI_WORKERS"] = str(args.workers)
+    os.environ["IDEXTRACTOR_SHUTDOWN_GRACE"] = str(args.shutdown_grace)
+
+    import uvicorn
+    import AsyncAPI
+
+    print(f"Starting OCR server on http://{args.host}:{args.port} with {args.workers} extraction worker(s)")
+    # A single front process: the CPU-bound work is in the extraction workers, not the event loop
+    uvicorn.run(AsyncAPI.app, host=args.host, port=args.port, workers=1, timeout_graceful_shutdown=args.shutdown_grace)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())